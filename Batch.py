@@ -0,0 +1,111 @@
+#Headless batch runner, applies one edit recipe to many photos without opening the editor
+#python Batch.py recipe.json photos/ "holiday/*.jpg" --format png --workers 4
+from multiprocessing import Pool
+from pathlib import Path
+import argparse
+import glob
+import os
+import sys
+from Settings import *
+from Decode import PHOTO_EXTENSIONS, open_for_edit
+from Export import export_path
+from Cache import RenderCache
+from Pipeline import apply_edits
+from Recipe import load_recipe, write_sidecar, is_export
+
+#Directories expand to the photos inside them, anything else is treated as a glob
+def collect_sources(patterns):
+    sources = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = sorted(path.iterdir())
+        else:
+            candidates = sorted(Path(match) for match in glob.glob(pattern))
+        sources.extend(candidate for candidate in candidates if candidate.is_file() and candidate.suffix.lower() in PHOTO_EXTENSIONS)
+    return list(dict.fromkeys(sources))
+
+#Every worker process opens the render cache once
+render_cache = None
+
+#Runs in a worker process
+def process(job):
+    global render_cache
+    if render_cache is None:
+        render_cache = RenderCache(Path(__file__).resolve().parent / "cache" / "renders")
+
+    source, target, params, file, options = job
+    try:
+        render_cache.export(source, params, file, target, lambda: apply_edits(open_for_edit(source), params), options)
+        write_sidecar(target, params, source)
+        return source, target, None
+    except Exception as e:
+        return source, target, str(e)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Apply a Gallerie edit recipe to many photos")
+    parser.add_argument('recipe', help = "json file with the editing parameters")
+    parser.add_argument('sources', nargs = '+', help = "directories or glob patterns of photos")
+    parser.add_argument('--output', default = str(Path(__file__).resolve().parent / "photos"), help = "directory for the results")
+    parser.add_argument('--format', default = EXPORT_FORMATS[0], choices = EXPORT_FORMATS)
+    parser.add_argument('--quality', type = int, default = EXPORT_OPTIONS['quality'], help = "jpg and webp quality, 1 to 100")
+    parser.add_argument('--progressive', action = 'store_true', help = "progressive jpg")
+    parser.add_argument('--optimize', action = 'store_true', help = "extra encoder pass for smaller jpg and png files")
+    parser.add_argument('--subsampling', default = EXPORT_OPTIONS['subsampling'], choices = SUBSAMPLING_OPT)
+    parser.add_argument('--compress-level', type = int, default = EXPORT_OPTIONS['compress_level'], help = "png compression, 0 to 9")
+    parser.add_argument('--lossless', action = 'store_true', help = "lossless webp")
+    parser.add_argument('--suffix', default = '_edit', help = "appended to every file name")
+    parser.add_argument('--workers', type = int, default = os.cpu_count())
+    parser.add_argument('--overwrite', action = 'store_true', help = "render again even if the result already exists")
+    args = parser.parse_args(argv)
+
+    #json.JSONDecodeError is a ValueError as well
+    try:
+        params = load_recipe(args.recipe)
+    except (ValueError, OSError) as e:
+        parser.error(f"Cannot use recipe {args.recipe}: {e}")
+    options = {name: getattr(args, name) for name in EXPORT_OPTIONS}
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents = True, exist_ok = True)
+
+    #Results of earlier runs can sit in a source directory, they are never edited again:
+    #they have an export sidecar, or they are the result this run would write for another source
+    sources = [source for source in collect_sources(args.sources) if not is_export(source)]
+    targets = {source: export_path(output_dir, f'{source.stem}{args.suffix}', args.format) for source in sources}
+    results = {os.path.abspath(target) for target in targets.values()}
+
+    #Photos that only differ in extension would write the same result, none of them is guessed at
+    claims = {}
+    for source, target in targets.items():
+        claims.setdefault(os.path.abspath(target), []).append(source)
+    clashes = {target for target, claimants in claims.items() if len(claimants) > 1}
+    for target in sorted(clashes):
+        print(f"Skipping {', '.join(str(source) for source in claims[target])}: they would all be written to {target}")
+
+    #Results are written atomically, so an existing one is always complete and a rerun resumes where it stopped
+    jobs = []
+    skipped = 0
+    for source, target in targets.items():
+        if os.path.abspath(source) in results or os.path.abspath(target) in clashes:
+            continue
+        if not args.overwrite and os.path.exists(target):
+            skipped += 1
+            continue
+        jobs.append((str(source), target, params, args.format, options))
+
+    total = len(jobs)
+    print(f"{total} photos to process, {skipped} already done")
+
+    failed = 0
+    with Pool(processes = max(1, args.workers)) as pool:
+        for done, (source, target, error) in enumerate(pool.imap_unordered(process, jobs), start = 1):
+            if error is None:
+                print(f"[{done}/{total}] {source} -> {target}")
+            else:
+                failed += 1
+                print(f"[{done}/{total}] Error processing {source}: {error}")
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
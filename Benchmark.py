@@ -0,0 +1,247 @@
+#Headless benchmark of the edit pipeline, decoding and the photo grids, results go to a json file
+#python Benchmark.py --sizes 2 12 --libraries 100 1000 --output cache/benchmark.json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from pathlib import Path
+from PIL import Image
+import PIL
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from Settings import *
+from Decode import HEIC_SUPPORT, register_heif, fit_size, decode_fit, open_for_edit
+from Pipeline import STAGES, StageCache, apply_edits
+from Blur import gaussian_blur
+from Cache import ThumbnailCache, make_thumbnail
+from Catalog import Catalog, SORT_COLUMNS
+from Layout import grid_layout, masonry_layout
+from Profiler import peak_rss
+
+#One setting per stage that makes it do real work
+STAGE_SETTINGS = {
+    'geometry': {'rotate': 30.0, 'zoom': 40.0, 'flip': 'X'},
+    'color': {'brightness': 1.4, 'vibrance': 1.6},
+    'blur': {'blur': 6.0},
+    'contrast': {'contrast': 5},
+    'effect': {'effect': 'Emboss'},
+}
+
+#Editor canvas of the default 1000x600 window
+EDITOR_CANVAS = (730, 580)
+LIBRARY_PHOTO_SIZE = (1600, 1200)
+LIBRARY_DISTINCT = 32
+
+#Same pixels on every run: a mandelbrot for detail, gradients for smooth areas
+def synthetic_image(megapixels, seed = 0):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    extent = (-2.2 + seed * 0.01, -1.2, 1.0, 1.2)
+    detail = Image.effect_mandelbrot((width, height), extent, 100)
+    horizontal = Image.linear_gradient('L').rotate(90).resize((width, height))
+    radial = Image.radial_gradient('L').resize((width, height))
+    return Image.merge('RGB', (detail, horizontal, radial))
+
+def photo_formats():
+    formats = ['jpg', 'png', 'webp']
+    if HEIC_SUPPORT:
+        register_heif()
+        formats.append('heic')
+    return formats
+
+def save_photo(image, path):
+    image.save(path, format = Image.registered_extensions()[path.suffix.lower()])
+
+class Benchmark:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    #Times fn repeat times, memory is the python heap peak and the process high-water mark afterwards
+    def measure(self, group, name, fn, repeat = None, **info):
+        repeat = repeat or self.repeat
+        times = []
+        tracemalloc.start()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        python_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        result = {
+            'group': group,
+            'name': name,
+            **info,
+            'runs': repeat,
+            'seconds': {'min': min(times), 'median': statistics.median(times), 'mean': statistics.mean(times)},
+            'python_peak_bytes': python_peak,
+            'max_rss_bytes': peak_rss()
+        }
+        self.results.append(result)
+        print(f"{group:<10} {name:<48} {result['seconds']['median'] * 1000:10.2f} ms")
+        return result
+
+    #Every stage alone, every on/off combination of the stages, and the cached preview path
+    def pipeline(self, megapixels):
+        source = synthetic_image(megapixels)
+        proxy = source.resize(fit_size(source.size, EDITOR_CANVAS), Image.Resampling.LANCZOS)
+        proxy_scale = proxy.width / source.width
+
+        for (stage, keys), (stage_name, settings) in zip(STAGES, STAGE_SETTINGS.items()):
+            params = PARAMETER_DEFAULTS | settings
+            self.measure('stage', f'{stage_name} {megapixels}MP', lambda: stage(source, params, 1), megapixels = megapixels, params = settings)
+            self.measure('stage', f'{stage_name} proxy {proxy.width}x{proxy.height}', lambda: stage(proxy, params, proxy_scale), megapixels = megapixels, params = settings)
+
+        #Every blur tier at the largest radius of the slider
+        for quality in BLUR_TIERS:
+            self.measure('blur', f'{quality} radius 30 {megapixels}MP', lambda: gaussian_blur(source, 30, quality), megapixels = megapixels, quality = quality)
+
+        for enabled in product((False, True), repeat = len(STAGE_SETTINGS)):
+            params = dict(PARAMETER_DEFAULTS)
+            names = []
+            for on, (stage_name, settings) in zip(enabled, STAGE_SETTINGS.items()):
+                if on:
+                    params.update(settings)
+                    names.append(stage_name)
+            label = '+'.join(names) or 'defaults'
+            self.measure('combined', f'{label} {megapixels}MP', lambda: apply_edits(source, params), repeat = 1, megapixels = megapixels, stages = names)
+
+        #What manipulate_image costs per slider move: the proxy render with one control changing
+        stage_cache = StageCache()
+        params = PARAMETER_DEFAULTS | {name: value for settings in STAGE_SETTINGS.values() for name, value in settings.items()}
+        params['display'] = proxy.size
+        stage_cache.render(proxy, params, proxy_scale)
+        for stage_name, settings in STAGE_SETTINGS.items():
+            name = next(iter(settings))
+            toggle = [False]
+            #Flips the control between two values, so every call recomputes from that stage on
+            def tweak():
+                toggle[0] = not toggle[0]
+                stage_cache.render(proxy, params | {name: PARAMETER_DEFAULTS[name] if toggle[0] else settings[name]}, proxy_scale)
+            self.measure('preview', f'{stage_name} slider {megapixels}MP', tweak, megapixels = megapixels, control = name)
+
+    #place_image converts every preview frame to a PhotoImage, only measurable with a display
+    def upload(self, megapixels):
+        try:
+            import tkinter
+            from PIL import ImageTk
+            root = tkinter.Tk()
+        except Exception as e:
+            print(f"Skipping PhotoImage upload: {e}")
+            return
+        try:
+            source = synthetic_image(megapixels)
+            proxy = source.resize(fit_size(source.size, EDITOR_CANVAS), Image.Resampling.LANCZOS)
+            self.measure('upload', f'PhotoImage {proxy.width}x{proxy.height}', lambda: ImageTk.PhotoImage(proxy), megapixels = megapixels)
+        finally:
+            root.destroy()
+
+    #Full decode for the editor and the reduced decodes behind the grids, in every format
+    def decode(self, megapixels, folder):
+        source = synthetic_image(megapixels)
+        for file in photo_formats():
+            path = folder / f'decode_{megapixels}mp.{file}'
+            save_photo(source, path)
+            info = {'megapixels': megapixels, 'format': file, 'file_bytes': path.stat().st_size}
+            self.measure('decode', f'open_for_edit {file} {megapixels}MP', lambda: open_for_edit(path).load(), **info)
+            self.measure('decode', f'decode_fit preview {file} {megapixels}MP', lambda: decode_fit(path, PREVIEW_SIZE), **info)
+            self.measure('decode', f'thumbnail square {file} {megapixels}MP', lambda: make_thumbnail(path, 'square'), **info)
+            self.measure('decode', f'thumbnail masonry {file} {megapixels}MP', lambda: make_thumbnail(path, 'masonry'), **info)
+
+    #What opening the manager and the gallery costs for a library of count photos
+    def library(self, count, folder, thumbnail_limit):
+        photos = folder / f'library_{count}'
+        photos.mkdir()
+        originals = []
+        for index in range(LIBRARY_DISTINCT):
+            path = folder / f'original_{index}.jpg'
+            if not path.exists():
+                synthetic_image(LIBRARY_PHOTO_SIZE[0] * LIBRARY_PHOTO_SIZE[1] / 1e6, index).save(path, quality = 90)
+            originals.append(path)
+        for index in range(count):
+            shutil.copyfile(originals[index % LIBRARY_DISTINCT], photos / f'photo_{index:05}.jpg')
+
+        info = {'photos': count}
+        catalog = Catalog(folder / f'catalog_{count}.sqlite3')
+        self.measure('library', f'catalog first scan {count}', lambda: catalog.scan(photos), repeat = 1, **info)
+        self.measure('library', f'catalog rescan {count}', lambda: catalog.scan(photos), **info)
+        entries = self.measure_value('library', f'catalog read {count}', lambda: catalog.photos(photos), **info)
+        for sort in SORT_COLUMNS:
+            self.measure('library', f'catalog page by {sort} {count}',
+                         lambda: catalog.query(photos, sort, True, offset = count // 2, limit = GRID_PAGE), **info)
+        self.measure('library', f'catalog search {count}', lambda: catalog.query(photos, search = '01', limit = GRID_PAGE), **info)
+
+        square = [THUMBNAIL_CARD_HEIGHT] * count
+        masonry = [max(1, int(entry.height * MASONRY_WIDTH / entry.width)) + GALLERY_CARD_EXTRA for entry in entries]
+        self.measure('library', f'grid layout {count}', lambda: grid_layout(square, THUMBNAIL_COLUMNS, GRID_GAP), **info)
+        self.measure('library', f'masonry layout {count}', lambda: masonry_layout(masonry, GALLERY_COLUMNS, GRID_GAP), **info)
+
+        #Thumbnails go through the same pool size as the app, first cold then from the disk cache
+        paths = [entry.path for entry in entries][:thumbnail_limit]
+        info['thumbnails'] = len(paths)
+        for variant in ('square', 'masonry'):
+            thumbnail_cache = ThumbnailCache(folder / f'thumbnails_{count}_{variant}')
+            def load_all():
+                with ThreadPoolExecutor(max_workers = os.cpu_count() or 4) as pool:
+                    list(pool.map(lambda path: thumbnail_cache.thumbnail(path, variant), paths))
+            self.measure('library', f'{variant} thumbnails cold {count}', load_all, repeat = 1, **info)
+            self.measure('library', f'{variant} thumbnails cached {count}', load_all, repeat = 1, **info)
+
+    def measure_value(self, group, name, fn, **info):
+        value = []
+        self.measure(group, name, lambda: value.append(fn()), **info)
+        return value[-1]
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the Gallerie pipeline, decoding and photo grids")
+    parser.add_argument('--sizes', type = float, nargs = '+', default = [2, 12, 24], help = "megapixels of the synthetic photos")
+    parser.add_argument('--libraries', type = int, nargs = '+', default = [100, 1000, 10000], help = "photo counts of the synthetic libraries")
+    parser.add_argument('--thumbnail-limit', type = int, default = 1000, help = "most thumbnails decoded per library")
+    parser.add_argument('--repeat', type = int, default = 5, help = "runs per measurement, the median is reported")
+    parser.add_argument('--only', nargs = '+', choices = ['pipeline', 'decode', 'library'], default = ['pipeline', 'decode', 'library'])
+    parser.add_argument('--output', default = str(Path(__file__).resolve().parent / "cache" / "benchmark.json"))
+    args = parser.parse_args(argv)
+
+    benchmark = Benchmark(args.repeat)
+    folder = Path(tempfile.mkdtemp(prefix = 'gallerie_benchmark_'))
+    try:
+        if 'pipeline' in args.only:
+            for megapixels in args.sizes:
+                benchmark.pipeline(megapixels)
+            benchmark.upload(args.sizes[0])
+        if 'decode' in args.only:
+            for megapixels in args.sizes:
+                benchmark.decode(megapixels, folder)
+        if 'library' in args.only:
+            for count in args.libraries:
+                benchmark.library(count, folder, args.thumbnail_limit)
+    finally:
+        shutil.rmtree(folder, ignore_errors = True)
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'heic': HEIC_SUPPORT
+        },
+        'arguments': vars(args),
+        'max_rss_bytes': peak_rss(),
+        'results': benchmark.results
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents = True, exist_ok = True)
+    output.write_text(json.dumps(report, indent = 2))
+    print(f"Results written to {output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+from PIL import Image, ImageFilter
+import math
+from Settings import *
+
+#Gaussian blur with radius as the standard deviation, like ImageFilter.GaussianBlur, at one of the BLUR_TIERS
+#Pillow already blurs with stacked box blurs, so its cost follows the pixel count and not the radius.
+#Large radii shrink the image by a whole factor first, blur what is left of the radius and scale back up
+def gaussian_blur(image, radius, quality = 'exact'):
+    if radius <= 0:
+        return image
+
+    factor = min(int(radius / BLUR_TIERS[quality]), image.width, image.height)
+    if factor < 2:
+        return image.filter(ImageFilter.GaussianBlur(radius))
+
+    #Averaging factor x factor blocks is a blur of its own, its variance comes off the radius left
+    small = image.reduce(factor)
+    left = math.sqrt(max(radius ** 2 - (factor ** 2 - 1) / 12, 0)) / factor
+    small = small.filter(ImageFilter.GaussianBlur(left))
+
+    #reduce() rounds the size up, the box keeps every pixel on the spot it was averaged from
+    return small.resize(image.size, Image.Resampling.BILINEAR, box = (0, 0, image.width / factor, image.height / factor))
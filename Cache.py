@@ -0,0 +1,232 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from PIL import Image
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from Settings import *
+from Decode import decode_fit, decode_width
+from Export import save_export, encoder_options
+from Recipe import recipe_data
+
+#Files on disk evicted least recently used first once the cache grows past its byte budget
+#The access order survives restarts through the file modification times
+#The GUI and every batch worker can share one directory, each keeps its own totals,
+#so a file can vanish under another process at any time and is then simply a miss
+class DiskCache:
+    def __init__(self, cache_dir, budget):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.budget = budget
+        self.lock = threading.Lock()
+
+        files = []
+        now = time.time()
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    #Leftovers from an interrupted write, newer ones may still be written by another process
+                    if entry.name.endswith('.tmp'):
+                        if now - stat.st_mtime > CACHE_TEMP_MAX_AGE:
+                            os.unlink(entry.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+
+        self.entries = OrderedDict((name, size) for _, name, size in sorted(files))
+        self.total = sum(self.entries.values())
+        self.evict()
+
+    def path(self, name):
+        return self.cache_dir / name
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.entries:
+                return None
+            self.entries.move_to_end(name)
+
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except OSError:
+            self.discard(name)
+            return None
+        return path
+
+    #write receives an open binary file, the entry only becomes visible once it is complete
+    def put(self, name, write):
+        path = self.path(name)
+        temp_path = self.path(f'{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(temp_path, 'wb') as file:
+            write(file)
+            size = file.tell()
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self.total += size - self.entries.pop(name, 0)
+            self.entries[name] = size
+            self.evict()
+        return path
+
+    def discard(self, name):
+        with self.lock:
+            self.total -= self.entries.pop(name, 0)
+        try:
+            self.path(name).unlink()
+        except OSError:
+            pass
+
+    def evict(self):
+        while self.total > self.budget and self.entries:
+            name, size = self.entries.popitem(last = False)
+            self.total -= size
+            try:
+                self.path(name).unlink()
+            except OSError:
+                pass
+
+#Pre scaled thumbnails keyed by photo path, file size and modification time
+class ThumbnailCache(DiskCache):
+    def __init__(self, cache_dir, budget = THUMBNAIL_CACHE_BUDGET):
+        super().__init__(cache_dir, budget)
+
+    def key(self, path, variant):
+        stat = os.stat(path)
+        source = f'{Path(path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{variant}|{DECODE_VERSION}'
+        return hashlib.sha1(source.encode()).hexdigest() + '.' + THUMBNAIL_CACHE_FORMAT.lower()
+
+    #variant is 'square' for the manager grid or 'masonry' for the gallery columns
+    def thumbnail(self, path, variant):
+        name = self.key(path, variant)
+
+        cached = self.get(name)
+        if cached is not None:
+            try:
+                img = Image.open(cached)
+                img.load()
+                return img
+            except OSError:
+                self.discard(name)
+
+        img = make_thumbnail(path, variant)
+        self.put(name, lambda file: img.save(file, THUMBNAIL_CACHE_FORMAT, quality = THUMBNAIL_CACHE_QUALITY))
+        return img
+
+def make_thumbnail(path, variant):
+    if variant == 'square':
+        img = decode_fit(path, (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    else:
+        img = decode_width(path, MASONRY_WIDTH)
+
+    #Keep transparency only when the photo has any
+    if img.mode in ('RGBA', 'LA') or 'transparency' in img.info:
+        return img.convert('RGBA')
+    return img.convert('RGB')
+
+#Content hash of a file, remembered per path, size and modification time so unchanged files are only read once
+FILE_DIGESTS = {}
+
+def file_digest(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in FILE_DIGESTS:
+        with open(path, 'rb') as file:
+            FILE_DIGESTS[key] = hashlib.file_digest(file, 'blake2b').hexdigest()
+    return FILE_DIGESTS[key]
+
+#Encoded exports addressed by the hash of the source content, the recipe, the format and its encoder options
+class RenderCache(DiskCache):
+    def __init__(self, cache_dir, budget = RENDER_CACHE_BUDGET):
+        super().__init__(cache_dir, budget)
+
+    def key(self, source, params, file, options = None):
+        recipe = json.dumps(recipe_data(params), sort_keys = True)
+        encoder = json.dumps(encoder_options(file, options), sort_keys = True)
+        digest = hashlib.sha256(f'{file_digest(source)}|{recipe}|{file.lower()}|{encoder}|{DECODE_VERSION}'.encode()).hexdigest()
+        return f'{digest}.{file.lower()}'
+
+    #render is only called when this exact export has never been made before
+    def export(self, source, params, file, export_string, render, options = None):
+        name = self.key(source, params, file, options)
+
+        cached = self.get(name)
+        if cached is not None:
+            #Copied under a temporary name like save_export, a cut off copy never looks like a finished export
+            temp_string = f'{export_string}.partial'
+            try:
+                shutil.copyfile(cached, temp_string)
+                os.replace(temp_string, export_string)
+                return
+            except FileNotFoundError:
+                #Evicted by another process since get()
+                self.discard(name)
+
+        save_export(render(), export_string, file, options)
+        with open(export_string, 'rb') as rendered:
+            self.put(name, lambda cache_file: shutil.copyfileobj(rendered, cache_file))
+
+#Decoded previews kept in memory, least recently used first out once they pass the byte budget
+#Keys carry the file's mtime so an edited file never shows a stale preview
+class PreviewCache:
+    def __init__(self, executor, budget = PREVIEW_CACHE_BUDGET):
+        self.executor = executor
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.images = OrderedDict()
+        self.pending = {}
+        self.size = 0
+
+    def key(self, path, box):
+        return (str(path), os.stat(path).st_mtime_ns, tuple(box))
+
+    #Preview from memory or decoded now, a preview already being decoded elsewhere is waited for instead
+    def preview(self, path, box):
+        key = self.key(path, box)
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+                return image
+            future = self.pending.get(key)
+            if future is None:
+                self.pending[key] = Future()
+
+        if future is not None:
+            return future.result()
+
+        try:
+            image = decode_fit(path, box)
+        except Exception as e:
+            with self.lock:
+                self.pending.pop(key).set_exception(e)
+            raise
+
+        with self.lock:
+            self.images[key] = image
+            self.size += image.width * image.height * len(image.getbands())
+            while self.size > self.budget and len(self.images) > 1:
+                old_key, old = self.images.popitem(last = False)
+                self.size -= old.width * old.height * len(old.getbands())
+            self.pending.pop(key).set_result(image)
+        return image
+
+    #Decodes previews on the executor so they are in memory by the time they are asked for
+    def prefetch(self, paths, box):
+        for path in paths:
+            try:
+                key = self.key(path, box)
+            except OSError:
+                continue
+            with self.lock:
+                if key in self.images or key in self.pending:
+                    continue
+            self.executor.submit(self.preview, path, box)
@@ -0,0 +1,216 @@
+from collections import namedtuple
+from pathlib import Path
+import os
+import sqlite3
+import threading
+from Decode import PHOTO_EXTENSIONS, open_image, read_orientation, turned
+
+PhotoEntry = namedtuple('PhotoEntry', ['path', 'name', 'width', 'height', 'size', 'mtime', 'format', 'taken', 'orientation'])
+Changes = namedtuple('Changes', ['added', 'removed', 'changed'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS photos (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    format TEXT,
+    taken TEXT,
+    orientation INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS photos_folder ON photos (folder, name);
+CREATE INDEX IF NOT EXISTS photos_date ON photos (folder, COALESCE(taken, datetime(mtime / 1000000000, 'unixepoch')), name);
+CREATE INDEX IF NOT EXISTS photos_size ON photos (folder, size, name);
+CREATE INDEX IF NOT EXISTS photos_dimensions ON photos (folder, (width * height), name);
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    dhash BLOB NOT NULL,
+    phash BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS unreadable (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL
+);
+'''
+
+#Sort orders of query(), each one has an index above so a page is read straight from it
+#Photos without a capture date sort by their modification time, in the same format as taken
+SORT_COLUMNS = {
+    'name': 'name',
+    'date': "COALESCE(taken, datetime(mtime / 1000000000, 'unixepoch'))",
+    'size': 'size',
+    'dimensions': '(width * height)',
+}
+ENTRY_COLUMNS = 'path, name, width, height, size, mtime, format, taken, orientation'
+
+#Capture date as a sortable string, from the EXIF header only
+def read_taken(img):
+    exif = img.getexif()
+    taken = exif.get_ifd(0x8769).get(0x9003) or exif.get(0x0132)
+    if not isinstance(taken, str) or len(taken) < 19:
+        return None
+    return taken[:10].replace(':', '-') + taken[10:19]
+
+#Everything the views need to know about a photo, read without decoding any pixels
+#Width and height are the upright size, turned by the EXIF orientation like every decode
+def read_header(path):
+    with open_image(path) as img:
+        orientation = read_orientation(img)
+        width, height = turned(img.size, orientation)
+        return width, height, img.format, read_taken(img), orientation
+
+#Persistent index of the photos folder, kept in sync by scan()
+class Catalog:
+    def __init__(self, db_path):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.migrate()
+
+    #Catalogs from before the orientation column are read again on the next scan, their sizes may be turned
+    def migrate(self):
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(photos)')}
+        if 'orientation' not in columns:
+            with self.db:
+                self.db.execute('ALTER TABLE photos ADD COLUMN orientation INTEGER NOT NULL DEFAULT 1')
+                self.db.execute('UPDATE photos SET mtime = 0')
+
+    #One scandir pass, only new or modified files have their header read
+    #Files whose header could not be read are remembered too, so they are only tried again once they change
+    def scan(self, folder):
+        folder = str(Path(folder).resolve())
+        with self.lock:
+            known = {path: (size, mtime) for path, size, mtime in
+                     self.db.execute('SELECT path, size, mtime FROM photos WHERE folder = ?', (folder,))}
+            failed = {path: (size, mtime) for path, size, mtime in
+                      self.db.execute('SELECT path, size, mtime FROM unreadable WHERE folder = ?', (folder,))}
+
+        rows, unreadable = [], []
+        added, changed = [], []
+        seen, still_failed = set(), set()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in PHOTO_EXTENSIONS:
+                    continue
+                stat = entry.stat()
+                if failed.get(entry.path) == (stat.st_size, stat.st_mtime_ns):
+                    still_failed.add(entry.path)
+                    continue
+                seen.add(entry.path)
+                if known.get(entry.path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+
+                try:
+                    width, height, format, taken, orientation = read_header(entry.path)
+                except Exception as e:
+                    print(f"Error reading {entry.path}: {e}")
+                    unreadable.append((entry.path, folder, stat.st_size, stat.st_mtime_ns))
+                    still_failed.add(entry.path)
+                    #A photo that became unreadable leaves the catalog
+                    seen.discard(entry.path)
+                    continue
+                rows.append((entry.path, folder, entry.name, width, height, stat.st_size, stat.st_mtime_ns, format, taken, orientation))
+                (changed if entry.path in known else added).append(Path(entry.path))
+
+        removed = [Path(path) for path in known if path not in seen]
+        #Failures that were deleted or changed and read fine this time
+        recovered = [path for path in failed if path not in still_failed]
+
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO photos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.db.executemany('INSERT OR REPLACE INTO unreadable VALUES (?, ?, ?, ?)', unreadable)
+            self.db.executemany('DELETE FROM unreadable WHERE path = ?', [(path,) for path in recovered])
+            self.db.executemany('DELETE FROM photos WHERE path = ?', [(str(path),) for path in removed])
+            self.db.executemany('DELETE FROM hashes WHERE path = ?', [(str(path),) for path in removed])
+
+        return Changes(added, removed, changed)
+
+    def photos(self, folder):
+        folder = str(Path(folder).resolve())
+        with self.lock:
+            rows = self.db.execute(f'SELECT {ENTRY_COLUMNS} FROM photos '
+                                   'WHERE folder = ? ORDER BY name', (folder,)).fetchall()
+        return [PhotoEntry(Path(row[0]), *row[1:]) for row in rows]
+
+    #WHERE clause and arguments for a filename search and a set of PIL formats, None is every format
+    def filters(self, folder, search, formats):
+        where = ['folder = ?']
+        args = [str(Path(folder).resolve())]
+        if search:
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            where.append("name LIKE ? ESCAPE '\\'")
+            args.append(f'%{escaped}%')
+        if formats is not None:
+            where.append(f"format IN ({', '.join('?' * len(formats))})")
+            args.extend(formats)
+        return ' AND '.join(where), args
+
+    #One page of the photos matching the filters, in one of the SORT_COLUMNS orders with the name breaking ties
+    def query(self, folder, sort = 'name', descending = False, search = '', formats = None, offset = 0, limit = -1):
+        where, args = self.filters(folder, search, formats)
+        direction = 'DESC' if descending else 'ASC'
+        order = f'{SORT_COLUMNS[sort]} {direction}, name {direction}' if sort != 'name' else f'name {direction}'
+        with self.lock:
+            rows = self.db.execute(f'SELECT {ENTRY_COLUMNS} FROM photos WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?',
+                                   args + [limit, offset]).fetchall()
+        return [PhotoEntry(Path(row[0]), *row[1:]) for row in rows]
+
+    def count(self, folder, search = '', formats = None):
+        where, args = self.filters(folder, search, formats)
+        with self.lock:
+            return self.db.execute(f'SELECT COUNT(*) FROM photos WHERE {where}', args).fetchone()[0]
+
+    def entry(self, path):
+        with self.lock:
+            row = self.db.execute(f'SELECT {ENTRY_COLUMNS} FROM photos '
+                                  'WHERE path = ?', (str(path),)).fetchone()
+        return PhotoEntry(Path(row[0]), *row[1:]) if row else None
+
+    #Entries of the paths still in the catalog, as {path: entry}
+    def entries(self, paths):
+        paths = [str(path) for path in paths]
+        rows = []
+        with self.lock:
+            #Below the smallest bound variable limit of older SQLite builds
+            for start in range(0, len(paths), 500):
+                chunk = paths[start:start + 500]
+                rows += self.db.execute(f"SELECT {ENTRY_COLUMNS} FROM photos WHERE path IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+        return {Path(row[0]): PhotoEntry(Path(row[0]), *row[1:]) for row in rows}
+
+    def remove(self, path):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM photos WHERE path = ?', (str(path),))
+            self.db.execute('DELETE FROM hashes WHERE path = ?', (str(path),))
+
+    #Perceptual hashes still matching the file on disk, as {path: (dhash, phash)}
+    def hashes(self, folder):
+        folder = str(Path(folder).resolve())
+        with self.lock:
+            rows = self.db.execute('SELECT photos.path, dhash, phash FROM photos JOIN hashes ON hashes.path = photos.path '
+                                   'AND hashes.size = photos.size AND hashes.mtime = photos.mtime '
+                                   'WHERE folder = ?', (folder,)).fetchall()
+        return {Path(path): (int.from_bytes(dhash, 'big'), int.from_bytes(phash, 'big')) for path, dhash, phash in rows}
+
+    #Photos never hashed or modified since, as (path, size, mtime)
+    def unhashed(self, folder):
+        folder = str(Path(folder).resolve())
+        with self.lock:
+            rows = self.db.execute('SELECT photos.path, photos.size, photos.mtime FROM photos LEFT JOIN hashes '
+                                   'ON hashes.path = photos.path AND hashes.size = photos.size AND hashes.mtime = photos.mtime '
+                                   'WHERE folder = ? AND hashes.path IS NULL ORDER BY name', (folder,)).fetchall()
+        return [(Path(path), size, mtime) for path, size, mtime in rows]
+
+    #rows are (path, size, mtime, dhash, phash), the size and mtime the hashes were made from
+    def store_hashes(self, rows):
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)',
+                                [(str(path), size, mtime, dhash.to_bytes(8, 'big'), phash.to_bytes(8, 'big'))
+                                 for path, size, mtime, dhash, phash in rows])
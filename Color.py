@@ -0,0 +1,60 @@
+from PIL import Image, ImageOps, ImageEnhance
+from functools import lru_cache
+from Settings import *
+
+RAMP = Image.frombytes('L', (256, 1), bytes(range(256)))
+IDENTITY = list(range(256))
+INVERT = [255 - value for value in IDENTITY]
+
+#Lookup table built by running the real ImageEnhance.Brightness on every possible value,
+#so it truncates exactly like the blend it replaces
+@lru_cache(maxsize = 64)
+def brightness_lut(factor):
+    if factor == BRIGHTNESS_DEFAULT:
+        return IDENTITY
+    return list(ImageEnhance.Brightness(RAMP).enhance(factor).getdata())
+
+def compose(first, second):
+    return [second[value] for value in first]
+
+#Brightness, vibrance, grayscale and invert compiled into as few full image passes as possible
+#Point operations collapse into one lookup table, only vibrance still needs a blend against the luma
+def apply_color(image, brightness, vibrance, grayscale, invert):
+    if brightness == BRIGHTNESS_DEFAULT and vibrance == VIBRANCE_DEFAULT and not grayscale and not invert:
+        return image
+    if image.mode not in ('RGB', 'L'):
+        return apply_color_reference(image, brightness, vibrance, grayscale, invert)
+
+    invert_lut = INVERT if invert else IDENTITY
+    bands = len(image.getbands())
+
+    #Vibrance and grayscale do nothing to a single band image
+    if image.mode == 'L' or (vibrance == VIBRANCE_DEFAULT and not grayscale):
+        return image.point(compose(brightness_lut(brightness), invert_lut) * bands)
+
+    if brightness != BRIGHTNESS_DEFAULT:
+        image = image.point(brightness_lut(brightness) * bands)
+
+    if vibrance != VIBRANCE_DEFAULT:
+        #Same degenerate image as ImageEnhance.Color, built from one luma pass
+        luma = image.convert('L')
+        image = Image.blend(Image.merge('RGB', (luma, luma, luma)), image, vibrance)
+
+    #Grayscale and invert run on a single band when both are on
+    if grayscale:
+        image = image.convert('L')
+    if invert:
+        image = image.point(invert_lut * len(image.getbands()))
+    return image
+
+#The chain the engine replaces, still used for modes it does not cover
+def apply_color_reference(image, brightness, vibrance, grayscale, invert):
+    if brightness != BRIGHTNESS_DEFAULT:
+        image = ImageEnhance.Brightness(image).enhance(brightness)
+    if vibrance != VIBRANCE_DEFAULT:
+        image = ImageEnhance.Color(image).enhance(vibrance)
+    if grayscale:
+        image = ImageOps.grayscale(image)
+    if invert:
+        image = ImageOps.invert(image)
+    return image
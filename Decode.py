@@ -0,0 +1,156 @@
+from PIL import Image
+import importlib.util
+import os
+import threading
+from Settings import *
+from Profiler import profiled
+
+#heic support is known from the installed package, the codec itself only loads when the first heic file is opened
+HEIC_SUPPORT = importlib.util.find_spec('pillow_heif') is not None
+if not HEIC_SUPPORT:
+    print("Warning: pillow-heif not installed. HEIC files will not be supported.")
+
+HEIF_EXTENSIONS = ('.heic', '.heif')
+heif_lock = threading.Lock()
+heif_registered = False
+
+def register_heif():
+    global heif_registered
+    with heif_lock:
+        if not heif_registered:
+            from pillow_heif import register_heif_opener
+            register_heif_opener()
+            heif_registered = True
+
+#Image.open for every supported photo, registers the heic codec on first use
+def open_image(path):
+    if HEIC_SUPPORT and not heif_registered and os.path.splitext(str(path))[1].lower() in HEIF_EXTENSIONS:
+        register_heif()
+    return Image.open(path)
+
+#EXIF orientation -> transpose that turns the stored pixels upright, same table as ImageOps.exif_transpose
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+#Orientation tag of an opened file, read from the header without decoding
+def read_orientation(img):
+    try:
+        orientation = img.getexif().get(0x0112, 1)
+    except Exception:
+        return 1
+    return orientation if orientation in ORIENTATION_TRANSPOSE else 1
+
+#Swaps width and height for the orientations that turn the photo a quarter, works both ways
+def turned(size, orientation):
+    return (size[1], size[0]) if orientation in (5, 6, 7, 8) else size
+
+def orient(image, orientation):
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    return image.transpose(method) if method is not None else image
+
+#Upright size of a photo from its header
+def photo_size(path):
+    with open_image(path) as img:
+        return turned(img.size, read_orientation(img))
+
+#File types shown in the gallery and accepted by the batch runner
+PHOTO_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
+if HEIC_SUPPORT:
+    PHOTO_EXTENSIONS.append('.heic')
+
+#Size that fits inside box with the same ratio, never larger than the photo itself
+def fit_size(size, box):
+    scale = min(box[0] / size[0], box[1] / size[1], 1)
+    return (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+
+#Transparency is flattened onto white for the editor
+def flatten(image):
+    # Convert RGBA to RGB
+    if image.mode == 'RGBA':
+        rgb_image = Image.new('RGB', image.size, (255, 255, 255))
+        rgb_image.paste(image, mask=image.split()[3])
+        image = rgb_image
+    return image
+
+#Full resolution photo ready for the editor
+@profiled('decode.full')
+def open_for_edit(path):
+    image = open_image(path)
+    orientation = read_orientation(image)
+    image.load()
+    return flatten(orient(image, orientation))
+
+#Editor copy no larger than box, the full resolution is only decoded again for export
+@profiled('decode.working')
+def open_working_copy(path, box):
+    image = open_image(path)
+    orientation = read_orientation(image)
+    size = fit_size(turned(image.size, orientation), box)
+    return flatten(orient(decode_to(image, turned(size, orientation)), orientation))
+
+#Photo scaled to fit inside box, like Image.thumbnail
+@profiled('decode.fit')
+def decode_fit(path, box):
+    img = open_image(path)
+    orientation = read_orientation(img)
+    size = fit_size(turned(img.size, orientation), box)
+    return orient(decode_to(img, turned(size, orientation)), orientation)
+
+#Photo scaled to an exact width with the same ratio
+@profiled('decode.width')
+def decode_width(path, width):
+    img = open_image(path)
+    orientation = read_orientation(img)
+    upright = turned(img.size, orientation)
+    size = (width, max(1, int(upright[1] * width / upright[0])))
+    return orient(decode_to(img, turned(size, orientation)), orientation)
+
+#Asks the codec for the smallest image that still covers size before decoding, then shrinks in one resample
+def decode_to(img, size):
+    if size == img.size:
+        img.load()
+        return img
+
+    draft_size = (int(size[0] * DECODE_REDUCING_GAP), int(size[1] * DECODE_REDUCING_GAP))
+    #JPEG decodes with DCT scaling, HEIF picks its smallest embedded thumbnail that still fits
+    img.draft(None, draft_size)
+
+    #JPEG 2000 can skip resolution levels while decoding
+    if img.format == 'JPEG2000':
+        factor = 0
+        while img.size[0] >> (factor + 1) >= draft_size[0] and img.size[1] >> (factor + 1) >= draft_size[1]:
+            factor += 1
+        img.reduce = factor
+        #The reduced size only exists once decoded, resize would take its box from the full size
+        img.load()
+
+    #Palette images would fall back to nearest neighbour
+    if img.mode in ('P', '1'):
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+
+    #reducing_gap lets the same call box reduce by an integer factor before the final lanczos pass
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap = DECODE_REDUCING_GAP)
+
+#Level of an image pyramid, the photo at 1/2**level of its size ready for display
+#Halving is exact in the JPEG and HEIF decoders, so unlike decode_to the codec is asked for the size itself
+@profiled('decode.level')
+def decode_level(path, level):
+    img = open_image(path)
+    orientation = read_orientation(img)
+    size = (max(1, img.size[0] >> level), max(1, img.size[1] >> level))
+    img.draft(None, size)
+
+    if img.mode not in ('RGB', 'RGBA', 'L'):
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    if img.size != size:
+        img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap = DECODE_REDUCING_GAP)
+    else:
+        img.load()
+    return orient(img, orientation)
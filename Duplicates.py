@@ -0,0 +1,289 @@
+import customtkinter as ctk
+from PIL import Image
+import math
+from Settings import *
+from Decode import open_image, read_orientation, orient, decode_to, fit_size
+from Loader import EXECUTOR, ThumbnailLoader, run_in_background
+from Profiler import profiled
+
+#numpy hashes a whole batch in a few array operations, without it every photo is hashed on its own
+try:
+    import numpy
+except ImportError:
+    numpy = None
+    print("Warning: numpy not installed. Duplicate hashes will be computed one photo at a time.")
+
+#Rows of the orthonormal DCT-II matrix for the 8 lowest frequencies, pHash only keeps those
+DCT_SIZE = 8
+DCT_ROWS = [[math.sqrt((1 if k == 0 else 2) / DUPLICATE_SAMPLE) * math.cos(math.pi * (2 * n + 1) * k / (2 * DUPLICATE_SAMPLE))
+             for n in range(DUPLICATE_SAMPLE)] for k in range(DCT_SIZE)]
+
+def distance(a, b):
+    return (a ^ b).bit_count()
+
+#Most significant bit first, same order as numpy.packbits
+def pack_bits(bits):
+    value = 0
+    for bit in bits:
+        value = value << 1 | bool(bit)
+    return value
+
+#Upright grayscale photo squashed to a DUPLICATE_SAMPLE square, the codec draft keeps the decode small
+@profiled('duplicates.sample')
+def hash_sample(path):
+    img = open_image(path)
+    orientation = read_orientation(img)
+    img = decode_to(img, (DUPLICATE_SAMPLE, DUPLICATE_SAMPLE))
+    return orient(img.convert('L'), orientation)
+
+#dHash: every pixel of a 9x8 sample brighter than the one to its left
+def difference_sample(sample):
+    return sample.resize((DCT_SIZE + 1, DCT_SIZE), Image.Resampling.BOX)
+
+#(dhash, phash) for every sample, pHash is the 8x8 lowest DCT frequencies above their median (the DC term left out)
+def perceptual_hashes(samples):
+    if not samples:
+        return []
+    if numpy is not None:
+        return numpy_hashes(samples)
+    return [python_hash(sample) for sample in samples]
+
+def numpy_hashes(samples):
+    dct = numpy.array(DCT_ROWS)
+    pixels = numpy.stack([numpy.asarray(sample, dtype = numpy.float64) for sample in samples])
+    low = (dct @ pixels @ dct.T).reshape(len(samples), -1)
+    phash_bits = low > numpy.median(low[:, 1:], axis = 1, keepdims = True)
+
+    small = numpy.stack([numpy.asarray(difference_sample(sample), dtype = numpy.int16) for sample in samples])
+    dhash_bits = (small[:, :, 1:] > small[:, :, :-1]).reshape(len(samples), -1)
+
+    dhashes = numpy.packbits(dhash_bits, axis = 1)
+    phashes = numpy.packbits(phash_bits, axis = 1)
+    return [(int.from_bytes(d.tobytes(), 'big'), int.from_bytes(p.tobytes(), 'big')) for d, p in zip(dhashes, phashes)]
+
+def python_hash(sample):
+    pixels = list(sample.getdata())
+    rows = [pixels[y * DUPLICATE_SAMPLE:(y + 1) * DUPLICATE_SAMPLE] for y in range(DUPLICATE_SAMPLE)]
+    columns = [[sum(d * row[x] for d, row in zip(dct, rows)) for x in range(DUPLICATE_SAMPLE)] for dct in DCT_ROWS]
+    low = [sum(d * value for d, value in zip(dct, column)) for column in columns for dct in DCT_ROWS]
+    median = sorted(low[1:])[(len(low) - 1) // 2]
+
+    small = list(difference_sample(sample).getdata())
+    width = DCT_SIZE + 1
+    dhash_bits = [small[y * width + x + 1] > small[y * width + x] for y in range(DCT_SIZE) for x in range(DCT_SIZE)]
+    return pack_bits(dhash_bits), pack_bits(value > median for value in low)
+
+def safe_sample(path):
+    try:
+        return hash_sample(path)
+    except Exception as e:
+        print(f"Error hashing {path}: {e}")
+        return None
+
+#Hashes every photo the catalog has no current hash for, a batch at a time:
+#the samples decode in parallel on the executor, then the batch is hashed at once and stored
+def index_hashes(catalog, folder, executor = EXECUTOR):
+    missing = catalog.unhashed(folder)
+    for start in range(0, len(missing), DUPLICATE_BATCH):
+        batch = missing[start:start + DUPLICATE_BATCH]
+        samples = list(executor.map(safe_sample, [path for path, size, mtime in batch]))
+        hashed = [(row, sample) for row, sample in zip(batch, samples) if sample is not None]
+        hashes = perceptual_hashes([sample for row, sample in hashed])
+        catalog.store_hashes([(*row, dhash, phash) for (row, sample), (dhash, phash) in zip(hashed, hashes)])
+    return catalog.hashes(folder)
+
+#Multi-index search: the 64 bits are cut into radius + 1 segments and two hashes within radius of each other
+#agree exactly on at least one of them, so only hashes sharing a segment value are ever compared.
+#A BK-tree degenerates on hashes this evenly spread, most of the tree is within reach of every query
+def near_pairs(hashes, radius):
+    segments = radius + 1
+    for index in range(segments):
+        low, high = 64 * index // segments, 64 * (index + 1) // segments
+        mask = (1 << (high - low)) - 1
+        buckets = {}
+        for item, value in hashes:
+            buckets.setdefault(value >> low & mask, []).append((item, value))
+
+        for bucket in buckets.values():
+            for position, (item, value) in enumerate(bucket):
+                for other, other_value in bucket[position + 1:]:
+                    if distance(value, other_value) <= radius:
+                        yield item, other
+
+#Paths whose pHashes are within radius and dHashes agree as well, joined into groups of two or more
+@profiled('duplicates.group')
+def duplicate_groups(hashes, radius = DUPLICATE_DISTANCE, dhash_radius = DUPLICATE_DHASH_DISTANCE):
+    parent = {path: path for path in hashes}
+    def find(path):
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    for path, other in near_pairs([(path, phash) for path, (dhash, phash) in hashes.items()], radius):
+        if distance(hashes[path][0], hashes[other][0]) <= dhash_radius:
+            parent[find(other)] = find(path)
+
+    groups = {}
+    for path in hashes:
+        groups.setdefault(find(path), []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+#Groups as catalog entries, the photo to keep first: the most pixels, then the oldest file
+def find_duplicates(catalog, folder, executor = EXECUTOR):
+    groups = []
+    for group in duplicate_groups(index_hashes(catalog, folder, executor)):
+        entries = [entry for entry in map(catalog.entry, group) if entry is not None]
+        if len(entries) > 1:
+            groups.append(sorted(entries, key = lambda entry: (-entry.width * entry.height, entry.mtime, entry.name)))
+    return sorted(groups, key = lambda entries: entries[0].name)
+
+#Window listing the duplicate groups, every photo but the one to keep is ticked for deletion
+#on_deleted(paths) runs after the ticked photos were deleted
+class DuplicatesWindow(ctk.CTkToplevel):
+    def __init__(self, master, catalog, folder, thumbnail_cache, on_deleted):
+        super().__init__(master)
+        self.title("Duplicates")
+        self.geometry(DUPLICATES_SIZE)
+        self.catalog = catalog
+        self.on_deleted = on_deleted
+        self.closed = False
+        self.images = {}
+        self.cards = {}
+        self.groups = {}
+        self.loader = ThumbnailLoader(self, thumbnail_cache, 'square', self.place_thumbnail)
+
+        self.status = ctk.CTkLabel(self, text="Looking for duplicates...", font=("Arial", 16))
+        self.status.pack(pady=10)
+
+        self.list_frame = ctk.CTkScrollableFrame(self, fg_color=DARK_GREY)
+        self.list_frame.pack(fill='both', expand=True, padx=10)
+
+        footer = ctk.CTkFrame(self, fg_color='transparent')
+        footer.pack(fill='x', padx=10, pady=10)
+        self.delete_btn = ctk.CTkButton(footer, text="Delete Selected", width=160, height=40, state='disabled',
+                                        fg_color="#c0392b", hover_color="#e74c3c", command=self.confirm_delete)
+        self.delete_btn.pack(side='right')
+
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        self.bind('<Escape>', lambda event: self.close())
+
+        #Hashing a new library takes a while, the window stays responsive meanwhile
+        run_in_background(self, lambda: find_duplicates(catalog, folder), self.show_groups)
+
+    def close(self):
+        self.closed = True
+        self.loader.cancel()
+        self.destroy()
+
+    def show_groups(self, groups):
+        if self.closed:
+            return
+        if groups is None:
+            self.status.configure(text="Could not look for duplicates")
+            return
+
+        for index, entries in enumerate(groups):
+            group_frame = ctk.CTkFrame(self.list_frame)
+            group_frame.pack(fill='x', padx=5, pady=5)
+            ctk.CTkLabel(group_frame, text=f"{len(entries)} similar photos", font=("Arial", 14, "bold")).grid(
+                row=0, column=0, columnspan=DUPLICATE_COLUMNS, sticky='w', padx=10, pady=(5, 0))
+            self.groups[index] = group_frame
+
+            for position, entry in enumerate(entries):
+                self.make_card(group_frame, index, position, entry)
+                self.loader.load(entry.path, entry.path)
+
+        self.update_status()
+
+    def make_card(self, group_frame, group, position, entry):
+        card = ctk.CTkFrame(group_frame, fg_color='transparent')
+        card.grid(row=1 + position // DUPLICATE_COLUMNS, column=position % DUPLICATE_COLUMNS, padx=5, pady=5)
+
+        image_label = ctk.CTkLabel(card, text="Loading...", width=DUPLICATE_THUMBNAIL, height=DUPLICATE_THUMBNAIL)
+        image_label.pack()
+        info_text = f"{entry.name}\n{entry.width}x{entry.height}, {entry.size / 1024:.1f} KB"
+        ctk.CTkLabel(card, text=info_text, font=("Arial", 11)).pack()
+
+        selected = ctk.BooleanVar(value=position > 0)
+        ctk.CTkCheckBox(card, text="Delete", variable=selected, command=self.update_status).pack(pady=(2, 0))
+        self.cards[entry.path] = (card, image_label, selected, group)
+
+    def place_thumbnail(self, img_path, img, error):
+        card = self.cards.get(img_path)
+        if card is None:
+            return
+        if img is None:
+            print(f"Error loading {img_path}: {error}")
+            card[1].configure(text="Error")
+            return
+
+        ctk_photo = ctk.CTkImage(light_image=img, dark_image=img, size=fit_size(img.size, (DUPLICATE_THUMBNAIL, DUPLICATE_THUMBNAIL)))
+        self.images[img_path] = ctk_photo
+        card[1].configure(image=ctk_photo, text="")
+
+    def selected(self):
+        return [img_path for img_path, (card, image_label, selected, group) in self.cards.items() if selected.get()]
+
+    def update_status(self):
+        count = len(self.selected())
+        if self.groups:
+            self.status.configure(text=f"{len(self.groups)} groups of similar photos, {count} selected")
+        else:
+            self.status.configure(text="No duplicates found")
+        self.delete_btn.configure(text=f"Delete Selected ({count})", state='normal' if count else 'disabled')
+
+    def confirm_delete(self):
+        paths = self.selected()
+        confirm_window = ctk.CTkToplevel(self)
+        confirm_window.title("Confirm Delete")
+        confirm_window.geometry("300x150")
+        confirm_window.transient(self)
+        confirm_window.grab_set()
+
+        label = ctk.CTkLabel(confirm_window, text=f"Delete {len(paths)} photos?", font=("Arial", 14))
+        label.pack(pady=20)
+
+        btn_frame = ctk.CTkFrame(confirm_window, fg_color='transparent')
+        btn_frame.pack(pady=10)
+
+        def confirm():
+            confirm_window.destroy()
+            self.delete_photos(paths)
+
+        yes_btn = ctk.CTkButton(btn_frame, text="Yes", width=100,
+                               fg_color="#c0392b", hover_color="#e74c3c", command=confirm)
+        yes_btn.pack(side='left', padx=10)
+
+        no_btn = ctk.CTkButton(btn_frame, text="No", width=100, command=confirm_window.destroy)
+        no_btn.pack(side='left', padx=10)
+
+    def delete_photos(self, paths):
+        from Recipe import remove_sidecar
+        deleted = []
+        for img_path in paths:
+            try:
+                img_path.unlink()
+                remove_sidecar(img_path)
+                self.catalog.remove(img_path)
+                deleted.append(img_path)
+            except Exception as e:
+                print(f"Error deleting file: {e}")
+
+        #Groups left with a single photo have nothing to compare anymore
+        for img_path in deleted:
+            card, image_label, selected, group = self.cards.pop(img_path)
+            card.destroy()
+            self.images.pop(img_path, None)
+        for group, group_frame in list(self.groups.items()):
+            left = [img_path for img_path, card in self.cards.items() if card[3] == group]
+            if len(left) < 2:
+                for img_path in left:
+                    self.cards.pop(img_path)
+                    self.images.pop(img_path, None)
+                group_frame.destroy()
+                del self.groups[group]
+
+        self.update_status()
+        if deleted:
+            self.on_deleted(deleted)
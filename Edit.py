@@ -60,7 +60,16 @@ class ExportFrame(ctk.CTkFrame):
         #data
         self.name_string = ctk.StringVar()
         self.file_string = ctk.StringVar(value = 'jpg')
+        self.option_vars = {
+            'quality': ctk.IntVar(value = EXPORT_OPTIONS['quality']),
+            'progressive': ctk.BooleanVar(value = EXPORT_OPTIONS['progressive']),
+            'optimize': ctk.BooleanVar(value = EXPORT_OPTIONS['optimize']),
+            'subsampling': ctk.StringVar(value = EXPORT_OPTIONS['subsampling']),
+            'compress_level': ctk.IntVar(value = EXPORT_OPTIONS['compress_level']),
+            'lossless': ctk.BooleanVar(value = EXPORT_OPTIONS['lossless'])
+        }
 
         #Widgets
         FileNamePanel(self, self.name_string, self.file_string)
-        SaveButton(self, export_image, self.name_string, self.file_string)
+        EncoderPanel(self, self.file_string, self.option_vars)
+        SaveButton(self, export_image, self.name_string, self.file_string, self.option_vars)
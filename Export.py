@@ -0,0 +1,124 @@
+from PIL import Image
+import os
+import queue
+import threading
+from Settings import *
+
+#Naming rule shared by the editor and the batch runner
+def export_path(photos_dir, name, file):
+    return f'{photos_dir}/{name}.{file}'
+
+#Keyword arguments for Image.save, only the options the format understands
+def encoder_options(file, options = None):
+    options = EXPORT_OPTIONS | (options or {})
+    match file.lower():
+        case 'jpg' | 'jpeg':
+            return {'quality': int(options['quality']), 'progressive': bool(options['progressive']),
+                    'optimize': bool(options['optimize']), 'subsampling': options['subsampling']}
+        case 'png':
+            return {'compress_level': int(options['compress_level']), 'optimize': bool(options['optimize'])}
+        case 'webp':
+            return {'quality': int(options['quality']), 'lossless': bool(options['lossless']), 'method': WEBP_METHOD}
+    return {}
+
+def save_export(image, export_string, file, options = None):
+    #Convert RGBA to RGB for JPEG export
+    if file.lower() in ['jpg', 'jpeg'] and image.mode == 'RGBA':
+        rgb_image = Image.new('RGB', image.size, (255, 255, 255))
+        rgb_image.paste(image, mask=image.split()[3])
+        image = rgb_image
+
+    #Written under a temporary name first, so an interrupted save never looks like a finished export
+    temp_string = f'{export_string}.partial'
+    image.save(temp_string, format = Image.registered_extensions()[f'.{file.lower()}'], **encoder_options(file, options))
+    os.replace(temp_string, export_string)
+
+class ExportCancelled(Exception):
+    pass
+
+#One export in the queue, state goes queued -> rendering -> encoding -> done, failed or cancelled
+class ExportJob:
+    def __init__(self, name, work):
+        self.name = name
+        self.work = work
+        self.state = 'queued'
+        self.error = None
+        self.cancelled = False
+
+    #Called by work between steps, a cancelled job stops at the next one
+    def check(self, next_state = None):
+        if self.cancelled:
+            raise ExportCancelled()
+        if next_state is not None:
+            self.state = next_state
+
+    def active(self):
+        return self.state in ('queued', 'rendering', 'encoding')
+
+#Runs exports one after another on a worker thread so the editor never waits for an encode
+#work(job) runs on the worker, on_update(jobs) runs on the tk main loop while anything is queued
+#and once more when the queue runs dry, after that the finished jobs are forgotten
+class ExportQueue:
+    def __init__(self, widget, on_update):
+        self.widget = widget
+        self.on_update = on_update
+
+        self.jobs = []
+        self.queue = queue.Queue()
+        self.poll_id = None
+
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def submit(self, name, work):
+        job = ExportJob(name, work)
+        self.jobs.append(job)
+        self.queue.put(job)
+
+        if self.poll_id is None:
+            self.poll_id = self.widget.after(EXPORT_POLL_MS, self.poll)
+        return job
+
+    def cancel(self):
+        for job in self.jobs:
+            job.cancelled = True
+
+    def active(self):
+        return [job for job in self.jobs if job.active()]
+
+    #The worker still finishes what is queued, wait() blocks until it has
+    def stop(self):
+        self.queue.put(None)
+        if self.poll_id is not None:
+            self.widget.after_cancel(self.poll_id)
+            self.poll_id = None
+
+    def wait(self):
+        self.thread.join()
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+
+            try:
+                job.check('rendering')
+                job.work(job)
+                job.state = 'done'
+            except ExportCancelled:
+                job.state = 'cancelled'
+            except Exception as e:
+                print(f"Error exporting {job.name}: {e}")
+                job.error = e
+                job.state = 'failed'
+
+    def poll(self):
+        self.poll_id = None
+        jobs = list(self.jobs)
+        self.on_update(jobs)
+
+        if any(job.active() for job in jobs):
+            self.poll_id = self.widget.after(EXPORT_POLL_MS, self.poll)
+        else:
+            self.jobs = [job for job in self.jobs if job not in jobs]
@@ -1,23 +1,27 @@
+import time
+STARTED = time.perf_counter()
+
+#Only what the main menu needs is imported here, the editor, the pipeline, the caches,
+#the catalog and the viewer load the first time they are used
 import customtkinter as ctk #using customtkinter for more customizability on ui, most if not all functions are the same as normal tkinter
+from tkinter import Entry
 from pathlib import Path
+from functools import cached_property
 from Widgets import *
-from Edit import *
-from PIL import Image, ImageTk, ImageOps, ImageEnhance, ImageFilter
+from Render import RenderScheduler
+from Export import export_path, ExportQueue
+from Loader import ThumbnailLoader, FolderWatcher, EXECUTOR
+from Profiler import PROFILER
+from Layout import grid_layout, masonry_layout, masonry_remove, masonry_extend, layout_height
+from collections import OrderedDict
+from PIL import Image
+import json
 import os
 import subprocess
 import sys
 
-#turns on heic support
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-    HEIC_SUPPORT = True
-except ImportError:
-    HEIC_SUPPORT = False
-    print("Warning: pillow-heif not installed. HEIC files will not be supported.")
-
 class Gallerie(ctk.CTk):
-    def __init__(self):
+    def __init__(self, measure_startup = False):
         #Initial setup
         super().__init__()
         ctk.set_appearance_mode("dark")
@@ -41,7 +45,21 @@ class Gallerie(ctk.CTk):
         self.image_height = 0
         self.canvas_width = 0
         self.canvas_height = 0
-
+        self.proxy = None
+        self.image_output = None
+        self.history = None
+        self.frames = None
+        self.shown_params = None
+        self.history_id = None
+        self.restoring = False
+        self.frame_started = time.perf_counter()
+        self.renderer = RenderScheduler(self, self.render_preview, self.show_preview)
+        self.export_status = ExportStatus(self, self.cancel_exports)
+        self.export_queue = ExportQueue(self, self.export_status.update_jobs)
+
+        #Screens are built once and shown again when coming back to them
+        self.photo_manager = None
+        self.gallery_view = None
         self.main_menu = MainMenu(
             master=self,
             on_import=self.handle_import,
@@ -50,9 +68,58 @@ class Gallerie(ctk.CTk):
             on_exit=self.handle_exit
         )
 
+        #Time to the first drawn main menu, --startup-time prints it and quits
+        self.measure_startup = measure_startup
+        self.startup_seconds = None
+        self.main_menu.bind('<Map>', lambda event: self.after_idle(self.first_frame), add='+')
+
+        #Closing the window waits for queued exports like the Exit button does
+        self.protocol('WM_DELETE_WINDOW', self.handle_exit)
+        self.bind('<F3>', self.toggle_overlay)
+        self.bind('<F4>', self.dump_trace)
+
         #Run program
         self.mainloop()
 
+    #Caches and the catalog open on first use, none of them is needed for the main menu
+    @cached_property
+    def thumbnail_cache(self):
+        from Cache import ThumbnailCache
+        return ThumbnailCache(Path(__file__).resolve().parent / "cache" / "thumbnails")
+
+    @cached_property
+    def render_cache(self):
+        from Cache import RenderCache
+        return RenderCache(Path(__file__).resolve().parent / "cache" / "renders")
+
+    @cached_property
+    def preview_cache(self):
+        from Cache import PreviewCache
+        return PreviewCache(EXECUTOR)
+
+    @cached_property
+    def catalog(self):
+        from Catalog import Catalog
+        return Catalog(Path(__file__).resolve().parent / "cache" / "catalog.sqlite3")
+
+    @cached_property
+    def stage_cache(self):
+        from Pipeline import StageCache
+        return StageCache()
+
+    def first_frame(self):
+        if self.startup_seconds is not None:
+            return
+        self.startup_seconds = time.perf_counter() - STARTED
+        if not self.measure_startup:
+            return
+
+        #Lazily loaded modules that should not be here yet
+        deferred = [name for name in ('Edit', 'Pipeline', 'Cache', 'Catalog', 'Viewer', 'History', 'Duplicates', 'pillow_heif', 'PIL.ImageFilter', 'PIL.ImageEnhance') if name in sys.modules]
+        print(json.dumps({'first_frame_ms': round(self.startup_seconds * 1000, 1), 'imports_ms': round(IMPORTED * 1000, 1),
+                          'modules': len(sys.modules), 'loaded_early': deferred}))
+        self.handle_exit()
+
     def init_parameters(self):
         self.pos_vars = {
             'rotate': ctk.DoubleVar(value = ROTATE_DEFAULT),
@@ -77,78 +144,144 @@ class Gallerie(ctk.CTk):
         for var in combined_vars:
             var.trace('w', self.manipulate_image)
 
+    #Plain values of every editing variable, so the pipeline never touches tk
+    def snapshot_parameters(self):
+        combined_vars = self.pos_vars | self.color_vars | self.effect_vars
+        return {name: var.get() for name, var in combined_vars.items()}
+
+    #Live preview runs on the proxy, full resolution is only used on export
     def manipulate_image(self, *args):
-        self.image = self.original
+        if self.proxy is None or self.restoring:
+            return
+        self.schedule_history()
+
+        #The geometry stage scales straight to the display size, place_image does not resample again
+        params = self.snapshot_parameters()
+        params['display'] = (self.image_width, self.image_height)
+        #Draft blur while the sliders move, exports render exact
+        params['quality'] = 'draft'
+        self.frame_started = time.perf_counter()
+
+        #States stepped to with undo and redo are usually still rendered, a frame in flight must not replace them
+        image = self.frames.get(params)
+        if image is not None:
+            self.renderer.cancel()
+            self.show_preview((params, image))
+        else:
+            self.renderer.submit((self.proxy, self.proxy_scale, params))
+
+    #Runs on the render worker, must not touch any tk object
+    def render_preview(self, request):
+        proxy, scale, params = request
+        with PROFILER.span('render'):
+            return params, self.stage_cache.render(proxy, params, scale)
 
-        #Rotate
-        if self.pos_vars['rotate'].get() != ROTATE_DEFAULT:
-            self.image = self.image.rotate(self.pos_vars['rotate'].get())
-
-        #Zoom
-        if self.pos_vars['zoom'].get() != ZOOM_DEFAULT:
-            self.image = ImageOps.crop(image = self.image, border= self.pos_vars['zoom'].get())
-
-        #Flip
-        if self.pos_vars['flip'].get() != FLIP_OPT[0]:
-            if self.pos_vars['flip'].get() == 'X':
-                self.image = ImageOps.mirror(self.image)
-            if self.pos_vars['flip'].get() == 'Y':
-                self.image = ImageOps.flip(self.image)
-            if self.pos_vars['flip'].get() == 'Both':
-                self.image = ImageOps.mirror(self.image)
-                self.image = ImageOps.flip(self.image)
-
-        #Brightness / Vibrance
-        if self.color_vars['brightness'].get() != BRIGHTNESS_DEFAULT:
-            brightness_enhancer = ImageEnhance.Brightness(self.image)
-            self.image = brightness_enhancer.enhance(self.color_vars['brightness'].get())
-
-        if self.color_vars['vibrance'].get() != VIBRANCE_DEFAULT:
-            vibrance_enhancer = ImageEnhance.Color(self.image)
-            self.image = vibrance_enhancer.enhance(self.color_vars['vibrance'].get())
-
-        #Color
-        if self.color_vars['grayscale'].get():
-            self.image = ImageOps.grayscale(self.image)
-        if self.color_vars['invert'].get():
-            self.image = ImageOps.invert(self.image)
-
-        #Blur & Contrast
-        if self.effect_vars['blur'].get() != BLUR_DEFAULT:
-            self.image = self.image.filter(ImageFilter.GaussianBlur(self.effect_vars['blur'].get()))
-
-        if self.effect_vars['contrast'].get() != CONTRAST_DEFAULT:
-            self.image = self.image.filter(ImageFilter.UnsharpMask(self.effect_vars['contrast'].get()))
-
-        match self.effect_vars['effect'].get():
-            case 'Emboss': self.image = self.image.filter(ImageFilter.EMBOSS)
-            case 'Find edges': self.image = self.image.filter(ImageFilter.FIND_EDGES)
-            case 'Contour': self.image = self.image.filter(ImageFilter.CONTOUR)
-            case 'Edge enhance': self.image = self.image.filter(ImageFilter.EDGE_ENHANCE_MORE)
+    def show_preview(self, result):
+        if self.proxy is None:
+            return
 
+        params, self.image = result
+        self.shown_params = params
         self.place_image()
+        self.keep_frame()
+
+        #Slider move to frame on screen, for the performance overlay
+        PROFILER.record('frame', self.frame_started, time.perf_counter())
+
+    #A burst of changes, like dragging a slider, becomes one undo step once it settles
+    def schedule_history(self):
+        if self.history_id is not None:
+            self.after_cancel(self.history_id)
+        self.history_id = self.after(HISTORY_DEBOUNCE_MS, self.commit_history)
+
+    def commit_history(self):
+        if self.history_id is not None:
+            self.after_cancel(self.history_id)
+            self.history_id = None
+        self.history.record(self.snapshot_parameters())
+        self.keep_frame()
+
+    #Only frames of history states are kept, the ones in between are never stepped to
+    def keep_frame(self):
+        params = self.shown_params
+        if params is not None and self.history is not None and all(params[name] == value for name, value in self.history.current.items()):
+            self.frames.put(params, self.image)
+
+    def undo(self, event = None):
+        self.step_history(self.history.undo)
+
+    def redo(self, event = None):
+        self.step_history(self.history.redo)
+
+    def step_history(self, move):
+        #Edits still settling are a step of their own, undo goes back to before them
+        self.commit_history()
+        params = move()
+        if params is not None:
+            self.apply_parameters(params)
+
+    #Sets every variable with a single render at the end instead of one per variable
+    def apply_parameters(self, params):
+        self.restoring = True
+        try:
+            self.restore_parameters(params)
+        finally:
+            self.restoring = False
+        self.manipulate_image()
+
+    #Downscaled copy of the original sized to the current canvas
+    def build_proxy(self):
+        if self.original.width > self.image_width or self.original.height > self.image_height:
+            with PROFILER.span('resize.proxy'):
+                self.proxy = self.original.resize((self.image_width, self.image_height), Image.Resampling.LANCZOS, reducing_gap = 3.0)
+        else:
+            self.proxy = self.original
+        #Pixel based parameters are in full resolution pixels, the working copy can be smaller
+        self.proxy_scale = self.proxy.width / self.source_size[0]
+        self.frames.clear()
 
     def handle_import(self, path):
-        self.original = Image.open(path)
-        # Convert RGBA to RGB
-        if self.original.mode == 'RGBA':
-            rgb_image = Image.new('RGB', self.original.size, (255, 255, 255))
-            rgb_image.paste(self.original, mask=self.original.split()[3])
-            self.original = rgb_image
+        #A photo with a recipe reopens from its source with the sliders where they were left
+        from Recipe import read_sidecar
+        from Decode import photo_size, open_for_edit, open_working_copy
+        from History import History, FrameCache
+        from Edit import Menu
+
+        self.source_path, params = read_sidecar(path)
+        if MEMORY_BUDGET_MODE:
+            self.source_size = photo_size(self.source_path)
+            self.original = open_working_copy(self.source_path, (self.winfo_screenwidth(), self.winfo_screenheight()))
+        else:
+            self.original = open_for_edit(self.source_path)
+            self.source_size = self.original.size
         
         self.image = self.original
-        self.image_ratio = self.image.size[0] / self.image.size[1]
-        self.image_tk = ImageTk.PhotoImage(self.image)
+        self.image_ratio = self.source_size[0] / self.source_size[1]
+        self.proxy = None
+        self.stage_cache.clear()
 
         self.reset_parameters()
+        if params is not None:
+            self.restore_parameters(params)
+        self.history = History(self.snapshot_parameters())
+        self.frames = FrameCache()
+        self.shown_params = None
+
+        #Ctrl+Shift+Z arrives as an upper case Z
+        self.bind('<Control-z>', self.undo)
+        self.bind('<Control-y>', self.redo)
+        self.bind('<Control-Z>', self.redo)
 
         self.main_menu.grid_forget()
         self.image_output = Import_Page(self, self.resize_image)
+        self.overlay = PerformanceOverlay(self.image_output, PROFILER)
         self.close_button = CloseButton(self, self.close_edit)
         self.menu = Menu(self, self.pos_vars, self.color_vars, self.effect_vars, self.export_image)
 
     #Resets all editing values
     def reset_parameters(self):
+        self.stage_cache.clear()
+
         #Reset position variables
         self.pos_vars['rotate'].set(ROTATE_DEFAULT)
         self.pos_vars['zoom'].set(ZOOM_DEFAULT)
@@ -165,18 +298,34 @@ class Gallerie(ctk.CTk):
         self.effect_vars['contrast'].set(CONTRAST_DEFAULT)
         self.effect_vars['effect'].set(EFFECT_OPT[0])
 
-    def close_edit(self):
-        self.image_output.grid_forget()
-        self.close_button.place_forget()
-        self.menu.grid_forget()
+    def restore_parameters(self, params):
+        combined_vars = self.pos_vars | self.color_vars | self.effect_vars
+        for name, value in params.items():
+            combined_vars[name].set(value)
 
-        self.main_menu = MainMenu(
-            master=self,
-            on_import=self.handle_import,
-            on_edit=self.handle_edit,
-            on_gallery=self.handle_gallery,
-            on_exit=self.handle_exit
-        )
+    def close_edit(self):
+        self.overlay.hide()
+        self.renderer.cancel()
+        self.proxy = None
+        self.stage_cache.clear()
+
+        if self.history_id is not None:
+            self.after_cancel(self.history_id)
+            self.history_id = None
+        for sequence in ('<Control-z>', '<Control-y>', '<Control-Z>'):
+            self.unbind(sequence)
+        self.history = None
+        self.frames = None
+        self.shown_params = None
+
+        #Nothing of the photo stays alive once the editor is gone
+        self.original = None
+        self.image = None
+        self.image_tk = None
+        self.image_output.destroy()
+        self.close_button.destroy()
+        self.menu.destroy()
+        self.main_menu.show()
 
     def resize_image(self, event):
         #Current canvas ratio
@@ -187,68 +336,122 @@ class Gallerie(ctk.CTk):
         self.canvas_height = event.height
         
         #Resize
+        previous_size = (self.image_width, self.image_height)
         if canvas_ratio > self.image_ratio:
-            self.image_height = int(event.height)
-            self.image_width = int(self.image_height * self.image_ratio)
+            self.image_height = max(1, int(event.height))
+            self.image_width = max(1, int(self.image_height * self.image_ratio))
         else:
-            self.image_width = int(event.width)
-            self.image_height = int(self.image_width  / self.image_ratio)
+            self.image_width = max(1, int(event.width))
+            self.image_height = max(1, int(self.image_width  / self.image_ratio))
 
-        self.place_image()
+        #Proxy only has to be rebuilt when the display size changes
+        if self.proxy is None or previous_size != (self.image_width, self.image_height):
+            self.build_proxy()
+            self.manipulate_image()
+        elif self.image.size == previous_size:
+            self.place_image()
 
+    #Only the preview is replaced, the performance overlay stays on top
     def place_image(self):
-        self.image_output.delete('all')
-        resized_image = self.image.resize((self.image_width, self.image_height))
-        self.image_tk = ImageTk.PhotoImage(resized_image)
-        self.image_output.create_image(self.canvas_width / 2, self.canvas_height / 2, image = self.image_tk)
-
-    def export_image(self, name, file):
-        export_string = f'{self.photos_dir}/{name}.{file}'
-        #Convert RGBA to RGB for JPEG export
-        if file.lower() in ['jpg', 'jpeg'] and self.image.mode == 'RGBA':
-            rgb_image = Image.new('RGB', self.image.size, (255, 255, 255))
-            rgb_image.paste(self.image, mask=self.image.split()[3])
-            rgb_image.save(export_string)
-        else:
-            self.image.save(export_string)
+        from PIL import ImageTk
+
+        self.image_output.delete('preview')
+        with PROFILER.span('upload'):
+            self.image_tk = ImageTk.PhotoImage(self.image)
+        self.image_output.create_image(self.canvas_width / 2, self.canvas_height / 2, image = self.image_tk, tags = 'preview')
+        self.image_output.tag_raise('overlay')
+
+    #Queued for the export worker, the editor closes right away
+    def export_image(self, name, file, options):
+        from Pipeline import apply_edits
+        from Recipe import write_sidecar, remove_sidecar
+        from Decode import open_for_edit
+
+        export_string = export_path(self.photos_dir, name, file)
+        params = self.snapshot_parameters()
+        original, source_path = self.original, self.source_path
+        if MEMORY_BUDGET_MODE:
+            original = None
+
+        #Runs on the export worker, must not touch any tk object
+        def work(job):
+            def render():
+                image = apply_edits(original if original is not None else open_for_edit(source_path), params)
+                job.check('encoding')
+                return image
+            self.render_cache.export(source_path, params, file, export_string, render, options)
+
+            #Saving over the source bakes the edit into its pixels, a recipe left there would apply it a second time
+            if os.path.abspath(export_string) == os.path.abspath(source_path):
+                remove_sidecar(source_path)
+                return
+
+            #Recipe next to the source and next to the export, so either one reopens with this edit
+            write_sidecar(source_path, params)
+            write_sidecar(export_string, params, source_path)
+
+        self.export_queue.submit(Path(export_string).name, work)
         self.close_edit()
 
+    def toggle_overlay(self, event):
+        if self.image_output is not None and self.image_output.winfo_exists():
+            self.overlay.toggle()
+
+    def dump_trace(self, event):
+        if PROFILER.enabled:
+            path = Path(__file__).resolve().parent / "cache" / "traces" / time.strftime("trace-%Y%m%d-%H%M%S.json")
+            print(f"Trace written to {PROFILER.dump_trace(path)}")
+
+    def cancel_exports(self):
+        self.export_queue.cancel()
+
     def handle_edit(self):
         self.main_menu.grid_forget()
-        self.photo_manager = PhotoManager(self, self.photos_dir, self.return_to_menu, self.edit_photo)
+        if self.photo_manager is None:
+            self.photo_manager = PhotoManager(self, self.photos_dir, self.catalog, self.thumbnail_cache, self.preview_cache, self.return_to_menu, self.edit_photo)
+        else:
+            self.photo_manager.show()
 
     def handle_gallery(self):
         self.main_menu.grid_forget()
-        self.gallery_view = GalleryView(self, self.photos_dir, self.return_to_menu)
+        if self.gallery_view is None:
+            self.gallery_view = GalleryView(self, self.photos_dir, self.catalog, self.thumbnail_cache, self.preview_cache, self.return_to_menu)
+        else:
+            self.gallery_view.show()
 
     def return_to_menu(self):
-        for widget in self.winfo_children():
-            widget.grid_forget()
-            widget.place_forget()
-        
-        self.main_menu = MainMenu(
-            master=self,
-            on_import=self.handle_import,
-            on_edit=self.handle_edit,
-            on_gallery=self.handle_gallery,
-            on_exit=self.handle_exit
-        )
+        self.main_menu.show()
 
     def edit_photo(self, photo_path):
         self.handle_import(photo_path)
 
+    #Exports already queued still finish after the window is gone
     def handle_exit(self):
+        self.renderer.stop()
+        self.export_queue.stop()
+        pending = len(self.export_queue.active())
         self.destroy()
+        if pending:
+            print(f"Finishing {pending} exports")
+        self.export_queue.wait()
 
 #Mangement page with photo preview
 class PhotoManager(ctk.CTkFrame):
-    def __init__(self, master, photos_dir, return_callback, edit_callback):
+    def __init__(self, master, photos_dir, catalog, thumbnail_cache, preview_cache, return_callback, edit_callback):
         super().__init__(master)
-        self.grid(row=0, column=0, columnspan=2, sticky='nsew')
         self.photos_dir = photos_dir
+        self.catalog = catalog
+        self.thumbnail_cache = thumbnail_cache
+        self.preview_cache = preview_cache
         self.return_callback = return_callback
         self.edit_callback = edit_callback
         self.selected_photo = None
+        self.loader = None
+        self.images = OrderedDict()
+        self.failed = set()
+        self.mtimes = {}
+        self.exhausted = False
+        self.watcher = FolderWatcher(self, catalog, photos_dir, self.apply_changes)
 
         self.rowconfigure(1, weight=1)
         self.columnconfigure(0, weight=1)
@@ -257,15 +460,24 @@ class PhotoManager(ctk.CTkFrame):
         header = ctk.CTkFrame(self, fg_color='transparent')
         header.grid(row=0, column=0, columnspan=2, sticky='ew', padx=10, pady=10)
         
-        back_btn = ctk.CTkButton(header, text="← Back", command=self.return_callback, width=100)
+        back_btn = ctk.CTkButton(header, text="← Back", command=self.close, width=100)
         back_btn.pack(side='left')
         
         title = ctk.CTkLabel(header, text="Manage Photos", font=("Arial", 24, "bold"))
         title.pack(side='left', padx=20)
 
-        #Grid for thumnails
-        self.thumbnail_frame = ctk.CTkScrollableFrame(self, fg_color=DARK_GREY)
-        self.thumbnail_frame.grid(row=1, column=0, sticky='nsew', padx=(10, 5), pady=10)
+        duplicates_btn = ctk.CTkButton(header, text="Find Duplicates", command=self.find_duplicates, width=140)
+        duplicates_btn.pack(side='right')
+
+        self.query_bar = QueryBar(header, self.set_query)
+        self.query_bar.pack(side='right', padx=10)
+        self.query = dict(self.query_bar.query)
+
+        #Grid for thumnails, only the visible cards exist as widgets and photos are read from the catalog a page at a time
+        self.thumbnail_grid = VirtualGrid(self, THUMBNAIL_SIZE + GRID_GAP, THUMBNAIL_COLUMNS,
+                                          self.make_card, self.bind_card, self.unbind_card,
+                                          fg_color=DARK_GREY, empty_text="No photos found", on_end=self.load_page)
+        self.thumbnail_grid.grid(row=1, column=0, sticky='nsew', padx=(10, 5), pady=10)
 
         #Full preview and vutton
         self.preview_frame = ctk.CTkScrollableFrame(self, fg_color=DARK_GREY)
@@ -275,60 +487,150 @@ class PhotoManager(ctk.CTkFrame):
                                           font=("Arial", 16))
         self.preview_label.pack(expand=True, pady=50)
 
+        #Shows what the catalog already knows, the watcher picks up changes to the folder in the background
         self.load_thumbnails()
+        self.show()
 
-    #Load thumbnail for photos
-    def load_thumbnails(self):        
-        for widget in self.thumbnail_frame.winfo_children():
-            widget.destroy()
+    def show(self):
+        self.grid(row=0, column=0, columnspan=2, sticky='nsew')
+        if self.loader is None:
+            self.loader = ThumbnailLoader(self, self.thumbnail_cache, 'square', self.place_thumbnail)
+            self.thumbnail_grid.rebind_visible()
+        self.sync(self.thumbnail_grid.items)
+        self.watcher.start()
+
+        #Arrow keys flip through the preview while the page is shown, except while they move the cursor of the search box
+        self.master.bind('<Left>', lambda event: self.on_arrow(event, -1))
+        self.master.bind('<Right>', lambda event: self.on_arrow(event, 1))
+
+    #Stops loading and watching, the page stays built for the next visit
+    def hide(self):
+        self.master.unbind('<Left>')
+        self.master.unbind('<Right>')
+        self.watcher.stop()
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader = None
+        self.grid_forget()
 
-        #Get all files
-        image_files = []
-        extensions = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp']
-        if HEIC_SUPPORT:
-            extensions.extend(['*.heic', '*.HEIC'])
-        
-        for ext in extensions:
-            image_files.extend(self.photos_dir.glob(ext))
+    def close(self):
+        self.hide()
+        self.return_callback()
+
+    #First page of the current query, changing the sort or filter only reads what fills the screen
+    def load_thumbnails(self):
+        entries = self.catalog.query(self.photos_dir, **self.query, limit=GRID_PAGE)
+        self.exhausted = len(entries) < GRID_PAGE
+        self.mtimes = {entry.path: entry.mtime for entry in entries}
+        image_files = [entry.path for entry in entries]
+        self.thumbnail_grid.set_items(image_files, *self.layout(image_files))
+        self.query_bar.show_count(self.catalog.count(self.photos_dir, self.query['search'], self.query['formats']))
+
+    #The catalog is shared with the other screens and their scans, so the loaded cards are checked against it
+    #whenever the page is shown instead of relying on the diffs of this page's own watcher
+    def sync(self, loaded):
+        from Catalog import Changes
+        entries = self.catalog.entries(loaded)
+        removed = [img_path for img_path in loaded if img_path not in entries]
+        changed = [img_path for img_path, entry in entries.items() if entry.mtime != self.mtimes.get(img_path)]
+
+        #New photos that sort among the loaded ones, the rest arrive with the next pages
+        fresh = self.catalog.query(self.photos_dir, **self.query, limit=-1 if self.exhausted else max(GRID_PAGE, len(loaded)))
+        known = set(loaded)
+        added = [entry.path for entry in fresh if entry.path not in known]
+
+        if added or removed or changed:
+            self.apply_changes(Changes(added, removed, changed))
+
+    def set_query(self, query):
+        self.query = query
+        self.load_thumbnails()
 
-        if not image_files:
-            no_photos = ctk.CTkLabel(self.thumbnail_frame, text="No photos found", 
-                                     font=("Arial", 14))
-            no_photos.pack(pady=20)
+    def load_page(self):
+        if self.exhausted:
+            return
+        entries = self.catalog.query(self.photos_dir, **self.query, offset=len(self.thumbnail_grid.items), limit=GRID_PAGE)
+        self.exhausted = len(entries) < GRID_PAGE
+        self.mtimes.update({entry.path: entry.mtime for entry in entries})
+        if entries:
+            image_files = self.thumbnail_grid.items + [entry.path for entry in entries]
+            self.thumbnail_grid.update_items(image_files, *self.layout(image_files))
+
+    #Every card has the same size, so the layout needs nothing from the files
+    def layout(self, image_files):
+        heights = [THUMBNAIL_CARD_HEIGHT] * len(image_files)
+        return grid_layout(heights, THUMBNAIL_COLUMNS, GRID_GAP)
+
+    #The loaded pages are read again with the new photos that sort among them,
+    #only the cards whose slot changed move, everything else keeps its widget and thumbnail
+    def apply_changes(self, changes):
+        limit = max(GRID_PAGE, len(self.thumbnail_grid.items) + len(changes.added))
+        entries = self.catalog.query(self.photos_dir, **self.query, limit=limit)
+        self.exhausted = len(entries) < limit
+        self.mtimes = {entry.path: entry.mtime for entry in entries}
+        image_files = [entry.path for entry in entries]
+
+        for img_path in changes.removed + changes.changed:
+            self.images.pop(img_path, None)
+            self.failed.discard(img_path)
+
+        self.thumbnail_grid.update_items(image_files, *self.layout(image_files))
+        for img_path in changes.changed:
+            self.thumbnail_grid.rebind_item(img_path)
+        self.query_bar.show_count(self.catalog.count(self.photos_dir, self.query['search'], self.query['formats']))
+
+    def make_card(self, master):
+        return ThumbnailCard(master, self.show_full_image)
+
+    #Cards get their thumbnail from memory or ask the pool for it
+    #Before show() there is no pool yet, it binds the visible cards again once there is
+    def bind_card(self, card, img_path):
+        image = self.images.get(img_path)
+        card.show(img_path, image)
+
+        if image is not None:
+            self.images.move_to_end(img_path)
+        elif img_path in self.failed:
+            card.set_error()
+        elif self.loader is not None:
+            self.loader.load(img_path, img_path)
+
+    def unbind_card(self, card, img_path):
+        if self.loader is not None:
+            self.loader.discard(img_path)
+
+    def place_thumbnail(self, img_path, img, error):
+        card = self.thumbnail_grid.card_for(img_path)
+        if img is None:
+            print(f"Error loading {img_path}: {error}")
+            self.failed.add(img_path)
+            if card is not None:
+                card.set_error()
             return
 
-        row, col = 0, 0
-        max_cols = 3
+        ctk_photo = ctk.CTkImage(light_image=img, dark_image=img, size=(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
 
-        for img_path in image_files:
-            try:
-                #Load & resize thumbnail
-                img = Image.open(img_path)
-                img.thumbnail((150, 150))
-                
-                ctk_photo = ctk.CTkImage(light_image=img, dark_image=img, size=(150, 150))
-
-                #Create button with thumbnail
-                btn_frame = ctk.CTkFrame(self.thumbnail_frame, fg_color='transparent')
-                btn_frame.grid(row=row, column=col, padx=5, pady=5)
-
-                btn = ctk.CTkButton(btn_frame, image=ctk_photo, text="", 
-                                   width=150, height=150,
-                                   command=lambda p=img_path: self.show_full_image(p))
-                btn.pack()
-
-                #Photo name
-                name_label = ctk.CTkLabel(btn_frame, text=img_path.name, 
-                                         font=("Arial", 10))
-                name_label.pack()
-
-                col += 1
-                if col >= max_cols:
-                    col = 0
-                    row += 1
+        #Only the most recently shown thumbnails stay in memory
+        self.images[img_path] = ctk_photo
+        if len(self.images) > GRID_IMAGE_CACHE:
+            self.images.popitem(last=False)
 
-            except Exception as e:
-                print(f"Error loading {img_path}: {e}")
+        if card is not None:
+            card.set_image(ctk_photo)
+
+    def neighbours(self, photo_path):
+        image_files = self.thumbnail_grid.items
+        index = image_files.index(photo_path)
+        return [image_files[(index + offset) % len(image_files)] for offset in (1, -1)]
+
+    def on_arrow(self, event, offset):
+        if not isinstance(event.widget, Entry):
+            self.show_neighbour(offset)
+
+    def show_neighbour(self, offset):
+        image_files = self.thumbnail_grid.items
+        if self.selected_photo in image_files:
+            self.show_full_image(self.neighbours(self.selected_photo)[0 if offset > 0 else 1])
 
     def show_full_image(self, photo_path):
         self.selected_photo = photo_path
@@ -337,13 +639,10 @@ class PhotoManager(ctk.CTkFrame):
             widget.destroy()
 
         try:
-            #Load image
-            img = Image.open(photo_path)
-            
-            #Resize image with same ratio
-            max_size = (600, 400)
-            img.thumbnail(max_size)
-            
+            #Preview reduced to the preview size with same ratio, kept in memory and the photos either side decoded ahead
+            img = self.preview_cache.preview(photo_path, PREVIEW_SIZE)
+            self.preview_cache.prefetch(self.neighbours(photo_path), PREVIEW_SIZE)
+
             ctk_photo = ctk.CTkImage(light_image=img, dark_image=img, 
                                      size=(img.width, img.height))
 
@@ -360,17 +659,28 @@ class PhotoManager(ctk.CTkFrame):
             btn_frame = ctk.CTkFrame(self.preview_frame, fg_color='transparent')
             btn_frame.pack(pady=20)
 
+            nav_frame = ctk.CTkFrame(self.preview_frame, fg_color='transparent')
+            nav_frame.pack()
+            prev_btn = ctk.CTkButton(nav_frame, text="‹ Previous", width=120, command=lambda: self.show_neighbour(-1))
+            prev_btn.grid(row=0, column=0, padx=10)
+            next_btn = ctk.CTkButton(nav_frame, text="Next ›", width=120, command=lambda: self.show_neighbour(1))
+            next_btn.grid(row=0, column=1, padx=10)
+
             edit_btn = ctk.CTkButton(btn_frame,text="Edit",width=120,height=40,command=lambda: self.edit_photo(photo_path))
             edit_btn.grid(row=0, column=0, padx=10)
 
+            view_btn = ctk.CTkButton(btn_frame, text="View", width=120, height=40,
+                                    command=lambda: self.open_viewer(photo_path))
+            view_btn.grid(row=0, column=1, padx=10)
+
             open_btn = ctk.CTkButton(btn_frame, text="Open File", width=120, height=40,
                                     command=lambda: self.open_file(photo_path))
-            open_btn.grid(row=0, column=1, padx=10)
+            open_btn.grid(row=0, column=2, padx=10)
 
             delete_btn = ctk.CTkButton(btn_frame, text="Delete", width=120, height=40,
                                       fg_color="#c0392b", hover_color="#e74c3c",
                                       command=lambda: self.delete_photo(photo_path))
-            delete_btn.grid(row=0, column=2, padx=10)
+            delete_btn.grid(row=0, column=3, padx=10)
 
         except Exception as e:
             error_label = ctk.CTkLabel(self.preview_frame, 
@@ -378,9 +688,17 @@ class PhotoManager(ctk.CTkFrame):
                                       font=("Arial", 14))
             error_label.pack(expand=True)
 
+    def open_viewer(self, photo_path):
+        image_files = list(self.thumbnail_grid.items)
+        #The preview outlives a new search or filter, a photo it no longer matches is viewed on its own
+        if photo_path not in image_files:
+            image_files = [photo_path]
+        from Viewer import TiledViewer
+        TiledViewer(self, image_files, image_files.index(photo_path), self.preview_cache)
+
     def edit_photo(self, photo_path):
         #Hide the photo manager page when edit
-        self.grid_forget()
+        self.hide()
         self.edit_callback(str(photo_path))
 
     def open_file(self, photo_path):
@@ -411,18 +729,13 @@ class PhotoManager(ctk.CTkFrame):
         btn_frame.pack(pady=10)
 
         def confirm_delete():
+            from Recipe import remove_sidecar
             try:
                 photo_path.unlink()
+                remove_sidecar(photo_path)
+                self.catalog.remove(photo_path)
                 confirm_window.destroy()
-                self.load_thumbnails()
-                
-                #Clears preview
-                for widget in self.preview_frame.winfo_children():
-                    widget.destroy()
-                self.preview_label = ctk.CTkLabel(self.preview_frame, 
-                                                 text="Photo deleted\nSelect another photo", 
-                                                 font=("Arial", 16))
-                self.preview_label.pack(expand=True)
+                self.remove_photos([photo_path])
             except Exception as e:
                 print(f"Error deleting file: {e}")
 
@@ -435,13 +748,42 @@ class PhotoManager(ctk.CTkFrame):
                               command=confirm_window.destroy)
         no_btn.pack(side='left', padx=10)
 
+    #Drops photos already deleted from disk and the catalog, clearing the preview if it showed one of them
+    def remove_photos(self, paths):
+        from Catalog import Changes
+        self.apply_changes(Changes([], list(paths), []))
+
+        if self.selected_photo in paths:
+            self.selected_photo = None
+            for widget in self.preview_frame.winfo_children():
+                widget.destroy()
+            self.preview_label = ctk.CTkLabel(self.preview_frame, 
+                                             text="Photo deleted\nSelect another photo", 
+                                             font=("Arial", 16))
+            self.preview_label.pack(expand=True)
+
+    #Near duplicates from the perceptual hashes in the catalog, photos not hashed yet are hashed first
+    def find_duplicates(self):
+        from Duplicates import DuplicatesWindow
+        DuplicatesWindow(self, self.catalog, self.photos_dir, self.thumbnail_cache, self.remove_photos)
+
 #Class for Pinterest like gallery
 class GalleryView(ctk.CTkFrame):
-    def __init__(self, master, photos_dir, return_callback):
+    def __init__(self, master, photos_dir, catalog, thumbnail_cache, preview_cache, return_callback):
         super().__init__(master)
-        self.grid(row=0, column=0, columnspan=2, sticky='nsew')
         self.photos_dir = photos_dir
+        self.catalog = catalog
+        self.thumbnail_cache = thumbnail_cache
+        self.preview_cache = preview_cache
         self.return_callback = return_callback
+        self.loader = None
+        self.images = OrderedDict()
+        self.failed = set()
+        self.heights = {}
+        self.mtimes = {}
+        self.positions = []
+        self.exhausted = False
+        self.watcher = FolderWatcher(self, catalog, photos_dir, self.apply_changes)
 
         self.rowconfigure(1, weight=1)
         self.columnconfigure(0, weight=1)
@@ -449,105 +791,192 @@ class GalleryView(ctk.CTkFrame):
         header = ctk.CTkFrame(self, fg_color='transparent')
         header.grid(row=0, column=0, sticky='ew', padx=10, pady=10)
         
-        back_btn = ctk.CTkButton(header, text="← Back", command=self.return_callback, width=100)
+        back_btn = ctk.CTkButton(header, text="← Back", command=self.close, width=100)
         back_btn.pack(side='left')
         
         title = ctk.CTkLabel(header, text="Gallery", font=("Arial", 24, "bold"))
         title.pack(side='left', padx=20)
 
-        self.gallery_frame = ctk.CTkScrollableFrame(self, fg_color=BACKGROUND_COLOR)
-        self.gallery_frame.grid(row=1, column=0, sticky='nsew', padx=10, pady=10)
+        self.query_bar = QueryBar(header, self.set_query)
+        self.query_bar.pack(side='right')
+        self.query = dict(self.query_bar.query)
 
+        #Masonry columns, only the visible cards exist as widgets and photos are read from the catalog a page at a time
+        self.gallery_grid = VirtualGrid(self, MASONRY_WIDTH + 2 * GRID_GAP + 10, GALLERY_COLUMNS,
+                                        self.make_card, self.bind_card, self.unbind_card,
+                                        fg_color=BACKGROUND_COLOR, empty_text="No photos in gallery", on_end=self.load_page)
+        self.gallery_grid.grid(row=1, column=0, sticky='nsew', padx=10, pady=10)
+
+        #Shows what the catalog already knows, the watcher picks up changes to the folder in the background
         self.load_gallery()
+        self.show()
+
+    def show(self):
+        self.grid(row=0, column=0, columnspan=2, sticky='nsew')
+        if self.loader is None:
+            self.loader = ThumbnailLoader(self, self.thumbnail_cache, 'masonry', self.place_thumbnail)
+            self.gallery_grid.rebind_visible()
+        self.sync(self.gallery_grid.items)
+        self.watcher.start()
+
+    #Stops loading and watching, the page stays built for the next visit
+    def close(self):
+        self.watcher.stop()
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader = None
+        self.grid_forget()
+        self.return_callback()
+
+    #Thumbnail heights come from the dimensions in the catalog, so the layout is known before anything is decoded
+    def card_height(self, entry):
+        return max(1, int(entry.height * MASONRY_WIDTH / entry.width))
 
-    #Loads all photos for gallery
+    #First page of the current query, heights come from the catalog so the layout is known before anything is decoded
     def load_gallery(self):
-        #Get all image files
-        image_files = []
-        extensions = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp']
-        if HEIC_SUPPORT:
-            extensions.extend(['*.heic', '*.HEIC'])
-        
-        for ext in extensions:
-            image_files.extend(self.photos_dir.glob(ext))
+        entries = self.catalog.query(self.photos_dir, **self.query, limit=GRID_PAGE)
+        self.exhausted = len(entries) < GRID_PAGE
+        image_files = [entry.path for entry in entries]
+        self.heights = {entry.path: self.card_height(entry) for entry in entries}
+        self.mtimes = {entry.path: entry.mtime for entry in entries}
+
+        #Cards go to the shortest column
+        heights = [self.heights[img_path] + GALLERY_CARD_EXTRA for img_path in image_files]
+        self.positions, total_height = masonry_layout(heights, GALLERY_COLUMNS, GRID_GAP)
+        self.gallery_grid.set_items(image_files, self.positions, total_height)
+        self.query_bar.show_count(self.catalog.count(self.photos_dir, self.query['search'], self.query['formats']))
+
+    #The catalog is shared with the other screens and their scans, so the loaded cards are checked against it
+    #whenever the page is shown instead of relying on the diffs of this page's own watcher
+    def sync(self, loaded):
+        from Catalog import Changes
+        entries = self.catalog.entries(loaded)
+        removed = [img_path for img_path in loaded if img_path not in entries]
+        changed = [img_path for img_path, entry in entries.items() if entry.mtime != self.mtimes.get(img_path)]
+
+        #New photos that sort among the loaded ones, the rest arrive with the next pages
+        fresh = self.catalog.query(self.photos_dir, **self.query, limit=-1 if self.exhausted else max(GRID_PAGE, len(loaded)))
+        known = set(loaded)
+        added = [entry.path for entry in fresh if entry.path not in known]
+
+        if added or removed or changed:
+            self.apply_changes(Changes(added, removed, changed))
+
+    def set_query(self, query):
+        self.query = query
+        self.load_gallery()
 
-        if not image_files:
-            no_photos = ctk.CTkLabel(self.gallery_frame, text="No photos in gallery", 
-                                     font=("Arial", 16))
-            no_photos.pack(pady=50)
+    #The next page goes below the cards already placed, none of them move
+    def load_page(self):
+        if self.exhausted:
+            return
+        entries = self.catalog.query(self.photos_dir, **self.query, offset=len(self.gallery_grid.items), limit=GRID_PAGE)
+        self.exhausted = len(entries) < GRID_PAGE
+        if entries:
+            self.extend(list(self.gallery_grid.items), self.positions, entries)
+
+    def extend(self, image_files, positions, entries):
+        for entry in entries:
+            self.heights[entry.path] = self.card_height(entry)
+            self.mtimes[entry.path] = entry.mtime
+            image_files.append(entry.path)
+        heights = [self.heights[entry.path] + GALLERY_CARD_EXTRA for entry in entries]
+        self.positions = masonry_extend(positions, heights, GALLERY_COLUMNS, GRID_GAP)
+        self.gallery_grid.update_items(image_files, self.positions, layout_height(self.positions, GRID_GAP))
+
+    #Removing a photo only moves the cards below it in its own column, new photos that sort after everything
+    #loaded go at the bottom of the shortest column, anything else packs the loaded cards again
+    def apply_changes(self, changes):
+        image_files = list(self.gallery_grid.items)
+        positions = self.positions
+        removed = list(changes.removed)
+        rebind = []
+
+        for img_path in changes.changed:
+            entry = self.catalog.entry(img_path)
+            if entry is not None and self.card_height(entry) == self.heights.get(img_path):
+                rebind.append(img_path)
+            else:
+                #Different shape, the card has to leave its column
+                removed.append(img_path)
+
+        for img_path in removed:
+            self.images.pop(img_path, None)
+            self.failed.discard(img_path)
+            self.heights.pop(img_path, None)
+            self.mtimes.pop(img_path, None)
+            if img_path in image_files:
+                index = image_files.index(img_path)
+                positions = masonry_remove(positions, index, GRID_GAP)
+                image_files.pop(index)
+
+        limit = max(GRID_PAGE, len(image_files) + len(changes.added) + len(changes.changed))
+        entries = self.catalog.query(self.photos_dir, **self.query, limit=limit)
+        self.exhausted = len(entries) < limit
+        self.mtimes.update({entry.path: entry.mtime for entry in entries})
+
+        if [entry.path for entry in entries[:len(image_files)]] == image_files:
+            self.extend(image_files, positions, entries[len(image_files):])
+        else:
+            self.extend([], [], entries)
+
+        for img_path in rebind:
+            self.images.pop(img_path, None)
+            self.failed.discard(img_path)
+
+        #A reshaped card that is still visible keeps its widget through update_items, so it is bound again as well
+        for img_path in changes.changed:
+            self.gallery_grid.rebind_item(img_path)
+        self.query_bar.show_count(self.catalog.count(self.photos_dir, self.query['search'], self.query['formats']))
+
+    def make_card(self, master):
+        return GalleryCard(master, self.open_fullscreen)
+
+    #Cards get their thumbnail from memory or ask the pool for it
+    #Before show() there is no pool yet, it binds the visible cards again once there is
+    def bind_card(self, card, img_path):
+        image = self.images.get(img_path)
+        card.show(img_path, image, self.heights[img_path])
+
+        if image is not None:
+            self.images.move_to_end(img_path)
+        elif img_path in self.failed:
+            card.set_error()
+        elif self.loader is not None:
+            self.loader.load(img_path, img_path)
+
+    def unbind_card(self, card, img_path):
+        if self.loader is not None:
+            self.loader.discard(img_path)
+
+    def place_thumbnail(self, img_path, img, error):
+        card = self.gallery_grid.card_for(img_path)
+        if img is None:
+            print(f"Error loading {img_path}: {error}")
+            self.failed.add(img_path)
+            if card is not None:
+                card.set_error()
             return
 
-        num_columns = 4
-        columns = [ctk.CTkFrame(self.gallery_frame, fg_color='transparent') 
-                   for _ in range(num_columns)]
-        
-        for i, col in enumerate(columns):
-            col.grid(row=0, column=i, sticky='nsew', padx=5)
-            self.gallery_frame.columnconfigure(i, weight=1, uniform='gallery')
+        #Use CTkImage for better scaling
+        ctk_photo = ctk.CTkImage(light_image=img, dark_image=img, 
+                                 size=(MASONRY_WIDTH, self.heights[img_path]))
 
-        for idx, img_path in enumerate(image_files):
-            try:
-                #Load image
-                img = Image.open(img_path)
-                
-                #Get thumbnail size with same size ratio
-                base_width = 220
-                w_percent = base_width / float(img.size[0])
-                h_size = int(float(img.size[1]) * w_percent)
-                img = img.resize((base_width, h_size), Image.Resampling.LANCZOS)
-                
-                #Use CTkImage for better scaling
-                ctk_photo = ctk.CTkImage(light_image=img, dark_image=img, 
-                                         size=(base_width, h_size))
-
-                #Determine which column to add to (round-robin)
-                col_idx = idx % num_columns
-
-                #Create card
-                card = ctk.CTkFrame(columns[col_idx], fg_color=DARK_GREY, corner_radius=10)
-                card.pack(pady=8, fill='x')
-
-                #Image button
-                btn = ctk.CTkButton(card, image=ctk_photo, text="", 
-                                   fg_color='transparent', hover_color=GREY,
-                                   command=lambda p=img_path: self.open_fullscreen(p))
-                btn.pack(padx=5, pady=5)
-
-                #Photo name
-                name_label = ctk.CTkLabel(card, text=img_path.stem, 
-                                         font=("Arial", 11, "bold"))
-                name_label.pack(padx=10, pady=(0, 10))
+        #Only the most recently shown thumbnails stay in memory
+        self.images[img_path] = ctk_photo
+        if len(self.images) > GRID_IMAGE_CACHE:
+            self.images.popitem(last=False)
 
-            except Exception as e:
-                print(f"Error loading {img_path}: {e}")
+        if card is not None:
+            card.set_image(ctk_photo)
 
-    #Opens the full image in a new window
+    #Opens the photo in the zoomable viewer
     def open_fullscreen(self, photo_path):
-        fullscreen_window = ctk.CTkToplevel(self)
-        fullscreen_window.title(photo_path.name)
-        fullscreen_window.geometry("800x600")
-        fullscreen_window.configure(fg_color=BACKGROUND_COLOR)
-
-        try:
-            img = Image.open(photo_path)
-            
-            # Resize to fit window
-            max_size = (750, 550)
-            img.thumbnail(max_size)
-            photo = ImageTk.PhotoImage(img)
-
-            label = ctk.CTkLabel(fullscreen_window, image=photo, text="")
-            label.image = photo  # Keep reference
-            label.pack(expand=True, pady=20)
+        image_files = list(self.gallery_grid.items)
+        from Viewer import TiledViewer
+        TiledViewer(self, image_files, image_files.index(photo_path), self.preview_cache)
 
-            close_btn = ctk.CTkButton(fullscreen_window, text="Close", 
-                                     command=fullscreen_window.destroy)
-            close_btn.pack(pady=10)
-
-        except Exception as e:
-            error_label = ctk.CTkLabel(fullscreen_window, 
-                                      text=f"Error loading image: {str(e)}", 
-                                      font=("Arial", 14))
-            error_label.pack(expand=True)
+IMPORTED = time.perf_counter() - STARTED
 
-Gallerie()
+if __name__ == '__main__':
+    Gallerie(measure_startup = '--startup-time' in sys.argv)
@@ -0,0 +1,69 @@
+from collections import OrderedDict
+from Settings import *
+
+#Undo and redo over snapshots of the editing parameters, current is the state on screen
+class History:
+    def __init__(self, params, limit = HISTORY_LIMIT):
+        self.limit = limit
+        self.current = dict(params)
+        self.undo_stack = []
+        self.redo_stack = []
+
+    #A new state drops everything that could have been redone
+    def record(self, params):
+        if params == self.current:
+            return
+        self.undo_stack.append(self.current)
+        del self.undo_stack[:-self.limit]
+        self.current = dict(params)
+        self.redo_stack = []
+
+    def undo(self):
+        if not self.undo_stack:
+            return None
+        self.redo_stack.append(self.current)
+        self.current = self.undo_stack.pop()
+        return self.current
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        self.undo_stack.append(self.current)
+        self.current = self.redo_stack.pop()
+        return self.current
+
+#Rendered previews of history states keyed by their full parameters, least recently used go first over the budget
+class FrameCache:
+    def __init__(self, budget = HISTORY_FRAME_BUDGET):
+        self.budget = budget
+        self.frames = OrderedDict()
+        self.used = 0
+
+    @staticmethod
+    def key(params):
+        return tuple(sorted(params.items()))
+
+    def get(self, params):
+        key = self.key(params)
+        image = self.frames.get(key)
+        if image is not None:
+            self.frames.move_to_end(key)
+        return image
+
+    def put(self, params, image):
+        key = self.key(params)
+        if key in self.frames:
+            self.frames.move_to_end(key)
+            return
+        self.frames[key] = image
+        self.used += self.size(image)
+        while self.used > self.budget and len(self.frames) > 1:
+            self.used -= self.size(self.frames.popitem(last = False)[1])
+
+    def clear(self):
+        self.frames.clear()
+        self.used = 0
+
+    @staticmethod
+    def size(image):
+        return image.width * image.height * len(image.getbands())
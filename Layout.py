@@ -0,0 +1,54 @@
+#Card placement for the photo grids, every position is (column, y, height)
+#Both return the positions and the total height of the content
+
+#Row by row, every row as tall as its tallest card
+def grid_layout(heights, columns, gap):
+    positions = []
+    y = gap
+    row_height = 0
+
+    for idx, height in enumerate(heights):
+        col = idx % columns
+        if col == 0 and idx:
+            y += row_height + gap
+            row_height = 0
+        positions.append((col, y, height))
+        row_height = max(row_height, height)
+
+    return positions, y + row_height + gap
+
+#Independent columns, every card goes to the shortest one so the columns end level
+#Ties go to the leftmost column, so equal heights still fill left to right
+def masonry_layout(heights, columns, gap):
+    positions = []
+    column_heights = [gap] * columns
+
+    for height in heights:
+        col = column_heights.index(min(column_heights))
+        positions.append((col, column_heights[col], height))
+        column_heights[col] += height + gap
+
+    return positions, max(column_heights)
+
+#Removes the card at index, only the cards below it in the same column move up
+def masonry_remove(positions, index, gap):
+    col, y, height = positions[index]
+    shift = height + gap
+    positions = positions[:index] + positions[index + 1:]
+    return [(c, top - shift, h) if c == col and top > y else (c, top, h) for c, top, h in positions]
+
+#Adds cards at the bottom of the shortest columns, nothing already placed moves
+def masonry_extend(positions, heights, columns, gap):
+    bottoms = [0] * columns
+    for c, top, h in positions:
+        bottoms[c] = max(bottoms[c], top + h)
+
+    positions = list(positions)
+    for height in heights:
+        col = bottoms.index(min(bottoms))
+        positions.append((col, bottoms[col] + gap, height))
+        bottoms[col] += height + gap
+    return positions
+
+def layout_height(positions, gap):
+    return max((top + h for c, top, h in positions), default = 0) + gap
@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
+import threading
+from Settings import *
+
+#Decoding releases the GIL, so one thread per core keeps every core busy
+EXECUTOR = ThreadPoolExecutor(max_workers = os.cpu_count() or 4, thread_name_prefix = 'loader')
+
+#Runs produce(*args) on the pool and streams the images back to the tk main loop in batches
+#on_ready(key, image, error) always runs on the main loop, image is None when loading failed
+class PoolLoader:
+    def __init__(self, widget, produce, on_ready):
+        self.widget = widget
+        self.produce = produce
+        self.on_ready = on_ready
+
+        self.results = queue.Queue()
+        self.futures = {}
+        self.poll_id = None
+        self.cancelled = False
+
+    def load(self, key, *args):
+        if self.cancelled or key in self.futures:
+            return
+        self.futures[key] = EXECUTOR.submit(self.work, key, args)
+
+        if self.poll_id is None:
+            self.poll_id = self.widget.after(THUMBNAIL_POLL_MS, self.poll)
+
+    def pending(self):
+        return list(self.futures)
+
+    #Drops a request that is no longer needed, an image already being decoded is simply ignored
+    def discard(self, key):
+        future = self.futures.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    #Runs on the pool
+    def work(self, key, args):
+        if self.cancelled:
+            return
+        try:
+            self.results.put((key, self.produce(*args), None))
+        except Exception as e:
+            self.results.put((key, None, e))
+
+    def poll(self):
+        self.poll_id = None
+        if self.cancelled:
+            return
+
+        for _ in range(THUMBNAIL_BATCH):
+            try:
+                key, image, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if self.futures.pop(key, None) is not None:
+                self.on_ready(key, image, error)
+
+        if self.futures:
+            self.poll_id = self.widget.after(THUMBNAIL_POLL_MS, self.poll)
+
+    def cancel(self):
+        self.cancelled = True
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+
+        if self.poll_id is not None:
+            self.widget.after_cancel(self.poll_id)
+            self.poll_id = None
+
+#Loads grid thumbnails through the disk cache
+class ThumbnailLoader(PoolLoader):
+    def __init__(self, widget, thumbnail_cache, variant, on_ready):
+        super().__init__(widget, lambda path: thumbnail_cache.thumbnail(path, variant), on_ready)
+
+#Runs work on its own thread and hands the result to on_done on the tk main loop, None if it failed
+def run_in_background(widget, work, on_done):
+    result = [None]
+
+    def run():
+        try:
+            result[0] = work()
+        except Exception as e:
+            print(f"Error in background task: {e}")
+
+    thread = threading.Thread(target = run, daemon = True)
+    thread.start()
+
+    def poll():
+        if thread.is_alive():
+            widget.after(THUMBNAIL_POLL_MS, poll)
+        else:
+            on_done(result[0])
+
+    widget.after(THUMBNAIL_POLL_MS, poll)
+
+#Polls a folder and reports catalog changes on the tk main loop
+#Adding, removing or renaming a file touches the folder itself, so most ticks are a single stat,
+#files edited in place are picked up by the full scan every WATCH_FULL_SCAN_TICKS ticks
+class FolderWatcher:
+    def __init__(self, widget, catalog, folder, on_changes):
+        self.widget = widget
+        self.catalog = catalog
+        self.folder = folder
+        self.on_changes = on_changes
+
+        self.after_id = None
+        self.scanning = False
+        self.folder_mtime = None
+        self.ticks = 0
+
+    def start(self):
+        self.stop()
+        self.folder_mtime = None
+        self.tick()
+
+    def stop(self):
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+
+    def tick(self):
+        self.after_id = self.widget.after(WATCH_INTERVAL_MS, self.tick)
+        if self.scanning:
+            return
+
+        self.ticks += 1
+        try:
+            folder_mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return
+        if folder_mtime == self.folder_mtime and self.ticks % WATCH_FULL_SCAN_TICKS:
+            return
+
+        self.folder_mtime = folder_mtime
+        self.scanning = True
+        run_in_background(self.widget, lambda: self.catalog.scan(self.folder), self.scanned)
+
+    def scanned(self, changes):
+        self.scanning = False
+        if self.after_id is None or changes is None:
+            return
+        if changes.added or changes.removed or changes.changed:
+            self.on_changes(changes)
@@ -5,6 +5,17 @@ class Panel(ctk.CTkFrame):
     def __init__(self, master):
         super().__init__(master, fg_color = DARK_GREY)
         self.pack(fill = 'x', pady = 4, ipady = 8)
+        self.traces = []
+
+    #Variables can outlive the panel, so their traces are removed with it
+    def trace(self, var, callback):
+        self.traces.append((var, var.trace_add('write', callback)))
+
+    def destroy(self):
+        for var, trace_id in self.traces:
+            var.trace_remove('write', trace_id)
+        self.traces = []
+        super().destroy()
 
 class SliderPanel(Panel):
     def __init__(self, master, text, data_var, min_value, max_value):
@@ -14,7 +25,7 @@ class SliderPanel(Panel):
         self.columnconfigure((0,1), weight=1)
 
         self.data_var = data_var
-        self.data_var.trace('w', self.update_text)
+        self.trace(self.data_var, self.update_text)
 
         ctk.CTkLabel(self, text = text).grid(column = 0, row = 0, sticky = 'W', padx = 8)
         self.num_label = ctk.CTkLabel(self, text = data_var.get())
@@ -45,17 +56,15 @@ class FileNamePanel(Panel):
         super().__init__(master)
         self.file_string = file_string
         self.name_string = name_string
-        self.name_string.trace('w', self.update_text)
+        self.trace(self.name_string, self.update_text)
 
 
         #File format check boxes
         ctk.CTkEntry(self, textvariable= self.name_string).pack(fill = 'x', padx = 20, pady = 5)
         frame = ctk.CTkFrame(self, fg_color= 'transparent')
-        jpg_check = ctk.CTkCheckBox(frame, text = 'jpg', variable= self.file_string, command= lambda: self.click('jpg'), onvalue='jpg', offvalue='png')
-        jpg_check.pack(side = 'left', fill = 'x', expand = True)
-
-        png_check = ctk.CTkCheckBox(frame, text = 'png', variable= self.file_string, command= lambda: self.click('png'), onvalue='png', offvalue='jpg')
-        png_check.pack(side = 'right', fill = 'x', expand = True)
+        for file in EXPORT_FORMATS:
+            check = ctk.CTkCheckBox(frame, text = file, variable= self.file_string, command= lambda file = file: self.click(file), onvalue=file, offvalue=file)
+            check.pack(side = 'left', fill = 'x', expand = True)
 
         frame.pack(expand = True, fill = 'x', padx = 20)
 
@@ -72,6 +81,53 @@ class FileNamePanel(Panel):
             text = self.name_string.get().replace(' ', '_') + '.' + self.file_string.get()
             self.output.configure(text = text)
 
+#Encoder settings, only the ones that apply to the chosen format are shown
+class EncoderPanel(Panel):
+    def __init__(self, master, file_string, option_vars):
+        super().__init__(master)
+        self.file_string = file_string
+        self.option_vars = option_vars
+        self.trace(self.file_string, self.update_options)
+
+        self.quality_label = ctk.CTkLabel(self, text = '')
+        self.quality = ctk.CTkSlider(self, fg_color = SLIDER_BG, variable = option_vars['quality'], from_ = 1, to = 100, number_of_steps = 99,
+                                     command = lambda value: self.update_text())
+        self.compress_label = ctk.CTkLabel(self, text = '')
+        self.compress = ctk.CTkSlider(self, fg_color = SLIDER_BG, variable = option_vars['compress_level'], from_ = 0, to = 9, number_of_steps = 9,
+                                      command = lambda value: self.update_text())
+        self.subsampling = ctk.CTkSegmentedButton(self, variable = option_vars['subsampling'], values = SUBSAMPLING_OPT)
+
+        self.switches = ctk.CTkFrame(self, fg_color = 'transparent')
+        self.progressive = ctk.CTkSwitch(self.switches, text = 'Progressive', variable = option_vars['progressive'], button_color = BLUE, fg_color = SLIDER_BG)
+        self.optimize = ctk.CTkSwitch(self.switches, text = 'Optimize', variable = option_vars['optimize'], button_color = BLUE, fg_color = SLIDER_BG)
+        self.lossless = ctk.CTkSwitch(self.switches, text = 'Lossless', variable = option_vars['lossless'], button_color = BLUE, fg_color = SLIDER_BG)
+
+        self.update_options()
+
+    def update_options(self, *args):
+        for widget in (self.quality_label, self.quality, self.compress_label, self.compress, self.subsampling, self.switches,
+                       self.progressive, self.optimize, self.lossless):
+            widget.pack_forget()
+
+        match self.file_string.get():
+            case 'jpg':
+                shown, switches = [self.quality_label, self.quality, self.subsampling], [self.progressive, self.optimize]
+            case 'png':
+                shown, switches = [self.compress_label, self.compress], [self.optimize]
+            case _:
+                shown, switches = [self.quality_label, self.quality], [self.lossless]
+
+        for widget in shown:
+            widget.pack(fill = 'x', padx = 8, pady = 2)
+        self.switches.pack(fill = 'x', padx = 8, pady = 2)
+        for switch in switches:
+            switch.pack(side = 'left', expand = True, fill = 'both', padx = 5, pady = 5)
+        self.update_text()
+
+    def update_text(self):
+        self.quality_label.configure(text = f"Quality  {self.option_vars['quality'].get()}")
+        self.compress_label.configure(text = f"Compression  {self.option_vars['compress_level'].get()}")
+
 class DropDownPanel(ctk.CTkOptionMenu):
     def __init__(self, master, data_var, options):
         super().__init__(master, values = options, fg_color=DARK_GREY, button_color=DROPDOWN_MAIN_COLOR, button_hover_color= DROPDOWN_HOVER_COLOR, dropdown_fg_color= DROPDOWN_MENU_COLOR, variable= data_var)
@@ -88,13 +144,15 @@ class RevertButton(ctk.CTkButton):
             var.set(value)
 
 class SaveButton(ctk.CTkButton):
-    def __init__(self, master, export_image, name_string, file_string):
+    def __init__(self, master, export_image, name_string, file_string, option_vars):
         super().__init__(master, text = 'Save', command = self.save)
         self.pack(side = 'bottom', pady = 10)
 
         self.export_image = export_image
         self.name_string = name_string
         self.file_string = file_string
+        self.option_vars = option_vars
 
     def save(self):
-        self.export_image(self.name_string.get(), self.file_string.get())
+        options = {name: var.get() for name, var in self.option_vars.items()}
+        self.export_image(self.name_string.get(), self.file_string.get(), options)
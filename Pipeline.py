@@ -0,0 +1,144 @@
+from PIL import Image, ImageFilter
+import math
+import threading
+from Settings import *
+from Color import apply_color
+from Blur import gaussian_blur
+from Profiler import PROFILER
+
+#Every stage takes the image, a plain snapshot of the parameters and the scale of the image relative to the original,
+#so pixel based values (zoom, blur, contrast) match on a proxy. Stages return the image and its new scale,
+#stages at their default return the image untouched
+
+#Rotate, zoom, flip and the optional resize to params['display'] folded into one affine matrix,
+#so the whole geometry costs a single allocation and a single interpolation pass
+def geometry(image, params, scale):
+    width, height = image.size
+    border = params['zoom'] * scale if params['zoom'] != ZOOM_DEFAULT else 0
+
+    #Same box ImageOps.crop would cut
+    left, top = round(border), round(border)
+    crop_width, crop_height = round(width - border) - left, round(height - border) - top
+    out_size = params.get('display') or (crop_width, crop_height)
+
+    flip_x = params['flip'] in ('X', 'Both')
+    flip_y = params['flip'] in ('Y', 'Both')
+    if params['rotate'] == ROTATE_DEFAULT and not border and not flip_x and not flip_y and out_size == image.size:
+        return image, scale
+
+    #Output -> crop space (resize and flip), then crop space -> source (translate)
+    sx, sy = crop_width / out_size[0], crop_height / out_size[1]
+    a, c = (-sx, crop_width + left) if flip_x else (sx, left)
+    e, f = (-sy, crop_height + top) if flip_y else (sy, top)
+
+    #Same rotation about the center as Image.rotate, applied after the translation above
+    angle = -math.radians(params['rotate'] % 360.0)
+    cos, sin = round(math.cos(angle), 15), round(math.sin(angle), 15)
+    cx, cy = width / 2.0, height / 2.0
+    matrix = (cos * a, sin * e, cos * (c - cx) + sin * (f - cy) + cx,
+              -sin * a, cos * e, -sin * (c - cx) + cos * (f - cy) + cy)
+
+    image = image.transform(out_size, Image.Transform.AFFINE, matrix, Image.Resampling.BICUBIC)
+    return image, scale * out_size[0] / crop_width
+
+#Brightness, vibrance, grayscale and invert run fused, see Color.apply_color
+def color(image, params, scale):
+    image = apply_color(image, params['brightness'], params['vibrance'], params['grayscale'], params['invert'])
+    return image, scale
+
+#params['quality'] picks the tier of Blur.gaussian_blur, anything without one is rendered exact
+def blur(image, params, scale):
+    if params['blur'] != BLUR_DEFAULT:
+        image = gaussian_blur(image, params['blur'] * scale, params.get('quality', 'exact'))
+    return image, scale
+
+def contrast(image, params, scale):
+    if params['contrast'] != CONTRAST_DEFAULT:
+        image = image.filter(ImageFilter.UnsharpMask(params['contrast'] * scale))
+    return image, scale
+
+def effect(image, params, scale):
+    match params['effect']:
+        case 'Emboss': image = image.filter(ImageFilter.EMBOSS)
+        case 'Find Edges': image = image.filter(ImageFilter.FIND_EDGES)
+        case 'Contour': image = image.filter(ImageFilter.CONTOUR)
+        case 'Edge Enhance': image = image.filter(ImageFilter.EDGE_ENHANCE_MORE)
+    return image, scale
+
+#Stages in the order they run, with the parameters each one reads
+STAGES = [
+    (geometry, ('rotate', 'zoom', 'flip', 'display')),
+    (color, ('brightness', 'vibrance', 'grayscale', 'invert')),
+    (blur, ('blur', 'quality')),
+    (contrast, ('contrast',)),
+    (effect, ('effect',)),
+]
+
+#Runs every editor step without caching, used for full resolution output
+def apply_edits(image, params, scale = 1):
+    for stage, keys in STAGES:
+        with PROFILER.span(f'stage.{stage.__name__}'):
+            image, scale = stage(image, params, scale)
+    return image
+
+def image_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+#Keeps the output of every stage keyed by its own inputs and the key of the stage before it,
+#so changing one control only recomputes that stage and the ones after it
+class StageCache:
+    def __init__(self, budget = PIPELINE_CACHE_BUDGET):
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.source = None
+        self.entries = {}
+        self.last_changed = 0
+
+    def clear(self):
+        with self.lock:
+            self.source = None
+            self.entries = {}
+
+    def render(self, source, params, scale = 1):
+        with self.lock:
+            if source is not self.source:
+                self.source = source
+                self.entries = {}
+            entries = self.entries
+
+        key = (scale,)
+        image = source
+        changed = None
+        for index, (stage, keys) in enumerate(STAGES):
+            key = (key, tuple(params.get(name) for name in keys))
+            entry = entries.get(index)
+            if entry is not None and entry[0] == key:
+                image, scale = entry[1], entry[2]
+                continue
+
+            if changed is None:
+                changed = index
+            with PROFILER.span(f'stage.{stage.__name__}'):
+                image, scale = stage(image, params, scale)
+            entries[index] = (key, image, scale)
+
+        with self.lock:
+            if changed is not None:
+                self.last_changed = changed
+            if entries is self.entries:
+                self.trim()
+        return image
+
+    #Outputs from the last changed stage onward are recomputed on the next tweak of the same control anyway,
+    #so they go first, then the earliest stages
+    def trim(self):
+        order = [index for index in sorted(self.entries, reverse = True) if index >= self.last_changed]
+        order += [index for index in sorted(self.entries) if index < self.last_changed]
+
+        while order and self.cached_bytes() > self.budget:
+            self.entries.pop(order.pop(0))
+
+    #Stages at their default hand the same image on, it only counts once and the source not at all
+    def cached_bytes(self):
+        images = {id(entry[1]): entry[1] for entry in self.entries.values() if entry[1] is not self.source}
+        return sum(image_bytes(image) for image in images.values())
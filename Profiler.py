@@ -0,0 +1,146 @@
+from collections import deque
+from contextlib import nullcontext
+from pathlib import Path
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from Settings import *
+
+#Peak resident memory of the process, not available on windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+NO_SPAN = nullcontext()
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return peak_rss()
+
+def peak_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Kilobytes on linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+class Span:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+
+#Timings of the hot paths, the last PROFILE_WINDOW of every name for the overlay and every span for the trace file
+#Off until enabled, a disabled span is a shared no-op context
+class Profiler:
+    def __init__(self, window = PROFILE_WINDOW, trace_events = PROFILE_TRACE_EVENTS):
+        self.always_on = os.environ.get('GALLERIE_PROFILE') == '1'
+        self.enabled = self.always_on
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.events = deque(maxlen = trace_events)
+        self.memory = deque(maxlen = trace_events)
+        self.threads = {}
+        self.origin = time.perf_counter()
+
+    def span(self, name):
+        return Span(self, name) if self.enabled else NO_SPAN
+
+    #start and end come from time.perf_counter
+    def record(self, name, start, end):
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen = self.window)
+            samples.append(end - start)
+            self.events.append((name, thread.ident, start, end))
+            self.threads[thread.ident] = thread.name
+
+    def sample_memory(self):
+        rss = current_rss()
+        if rss is not None:
+            with self.lock:
+                self.memory.append((time.perf_counter(), rss))
+        return rss
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+            self.events.clear()
+            self.memory.clear()
+
+    #count, last, p50, p95 and max in seconds for every name
+    def stats(self):
+        with self.lock:
+            samples = {name: sorted(values) for name, values in self.samples.items() if values}
+            last = {name: self.samples[name][-1] for name in samples}
+
+        return {name: {
+            'count': len(values),
+            'last': last[name],
+            'p50': values[len(values) // 2],
+            'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+            'max': values[-1]
+        } for name, values in samples.items()}
+
+    #Counts per bucket of PROFILE_BUCKETS_MS, the last bucket holds everything slower
+    def histogram(self, name):
+        with self.lock:
+            values = list(self.samples.get(name, ()))
+        counts = [0] * (len(PROFILE_BUCKETS_MS) + 1)
+        for value in values:
+            index = 0
+            while index < len(PROFILE_BUCKETS_MS) and value * 1000 > PROFILE_BUCKETS_MS[index]:
+                index += 1
+            counts[index] += 1
+        return counts
+
+    #Chrome trace event format, opens in chrome://tracing or ui.perfetto.dev
+    def dump_trace(self, path):
+        with self.lock:
+            events = list(self.events)
+            memory = list(self.memory)
+            threads = dict(self.threads)
+
+        pid = os.getpid()
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}} for tid, name in threads.items()]
+        trace += [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6} for name, tid, start, end in events]
+        trace += [{'name': 'rss', 'ph': 'C', 'pid': pid, 'ts': (sampled - self.origin) * 1e6,
+                   'args': {'MB': rss / 1024 / 1024}} for sampled, rss in memory]
+
+        path = Path(path)
+        path.parent.mkdir(parents = True, exist_ok = True)
+        path.write_text(json.dumps({'traceEvents': trace, 'displayTimeUnit': 'ms'}))
+        return path
+
+PROFILER = Profiler()
+
+#Wraps a function in a span of the shared profiler
+def profiled(name):
+    def wrap(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            with PROFILER.span(name):
+                return function(*args, **kwargs)
+        return timed
+    return wrap
@@ -0,0 +1,117 @@
+import json
+import os
+from Settings import *
+
+#Type of the tk variable behind every parameter
+PARAMETER_TYPES = {
+    'rotate': float,
+    'zoom': float,
+    'flip': str,
+    'brightness': float,
+    'grayscale': bool,
+    'invert': bool,
+    'vibrance': float,
+    'blur': float,
+    'contrast': int,
+    'effect': str
+}
+
+#Values are checked instead of converted, bool("false") would silently turn a setting on
+def parse_value(name, value):
+    kind = PARAMETER_TYPES[name]
+    if kind is bool:
+        valid = isinstance(value, bool)
+    elif kind is str:
+        valid = isinstance(value, str)
+    elif kind is int:
+        valid = isinstance(value, int) and not isinstance(value, bool)
+    else:
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    if not valid:
+        raise ValueError(f"{name} must be of type {kind.__name__}, got {json.dumps(value)}")
+    return kind(value)
+
+#Edit recipe: the values of pos_vars, color_vars and effect_vars as plain json
+#Missing parameters keep their default, unknown ones are an error
+def parse_recipe(data):
+    if not isinstance(data, dict):
+        raise ValueError("Recipe must be a json object")
+    unknown = set(data) - set(PARAMETER_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown recipe parameters: {', '.join(sorted(unknown))}")
+
+    params = dict(PARAMETER_DEFAULTS)
+    for name, value in data.items():
+        params[name] = parse_value(name, value)
+
+    if params['flip'] not in FLIP_OPT:
+        raise ValueError(f"flip must be one of {FLIP_OPT}")
+    if params['effect'] not in EFFECT_OPT:
+        raise ValueError(f"effect must be one of {EFFECT_OPT}")
+    return params
+
+def load_recipe(path):
+    with open(path) as file:
+        return parse_recipe(json.load(file))
+
+#Only the values that differ from the defaults, also the canonical form used for cache keys
+def recipe_data(params):
+    return {name: params[name] for name in PARAMETER_DEFAULTS if params[name] != PARAMETER_DEFAULTS[name]}
+
+def save_recipe(path, params):
+    with open(path, 'w') as file:
+        json.dump(recipe_data(params), file, indent = 4)
+
+#Sidecars sit next to a photo and hold the edit that made it
+#An exported photo also points back at its source, so editing it again starts from the untouched original
+def sidecar_path(path):
+    return f'{path}.recipe.json'
+
+def write_sidecar(path, params, source = None):
+    data = {'recipe': recipe_data(params)}
+    if source is not None and os.path.abspath(source) != os.path.abspath(path):
+        data['source'] = os.path.abspath(source)
+    try:
+        with open(sidecar_path(path), 'w') as file:
+            json.dump(data, file, indent = 4)
+    except OSError as e:
+        print(f"Error writing recipe for {path}: {e}")
+
+#Photo to open and the parameters to restore, params is None when there is nothing to restore
+def read_sidecar(path):
+    try:
+        with open(sidecar_path(path)) as file:
+            data = json.load(file)
+        if not isinstance(data, dict):
+            raise ValueError("Sidecar must be a json object")
+        params = parse_recipe(data.get('recipe', {}))
+        if not isinstance(data.get('source', ''), str):
+            raise ValueError("source must be a path")
+    except FileNotFoundError:
+        return path, None
+    except (OSError, ValueError) as e:
+        print(f"Error reading recipe for {path}: {e}")
+        return path, None
+
+    source = data.get('source')
+    if source is None:
+        return path, params
+    if os.path.exists(source):
+        return source, params
+
+    #Source is gone, the export itself becomes the starting point
+    return path, None
+
+#Whether path was written by an export, its sidecar names the photo it was made from
+def is_export(path):
+    try:
+        with open(sidecar_path(path)) as file:
+            return 'source' in json.load(file)
+    except (OSError, ValueError, TypeError):
+        return False
+
+def remove_sidecar(path):
+    try:
+        os.unlink(sidecar_path(path))
+    except FileNotFoundError:
+        pass
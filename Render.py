@@ -0,0 +1,86 @@
+import threading
+from Settings import *
+
+#Runs the preview render on a worker thread, stale requests are dropped so only the newest snapshot is rendered
+#render runs on the worker, on_result always runs on the tk main loop
+class RenderScheduler:
+    def __init__(self, widget, render, on_result):
+        self.widget = widget
+        self.render = render
+        self.on_result = on_result
+
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pending = None
+        self.result = None
+        self.generation = 0
+        self.finished = 0
+        self.cancelled = 0
+        self.poll_id = None
+        self.running = True
+
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def submit(self, request):
+        with self.lock:
+            self.generation += 1
+            #Overwrites any request the worker has not picked up yet
+            self.pending = (self.generation, request)
+        self.wake.set()
+
+        if self.poll_id is None:
+            self.poll_id = self.widget.after(RENDER_POLL_MS, self.poll)
+
+    def cancel(self):
+        with self.lock:
+            self.pending = None
+            self.result = None
+            self.cancelled = self.generation
+            self.finished = self.generation
+
+    def stop(self):
+        self.cancel()
+        self.running = False
+        self.wake.set()
+        if self.poll_id is not None:
+            self.widget.after_cancel(self.poll_id)
+            self.poll_id = None
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            with self.lock:
+                self.wake.clear()
+                job = self.pending
+                self.pending = None
+
+            if not self.running:
+                return
+            if job is None:
+                continue
+
+            generation, request = job
+            try:
+                image = self.render(request)
+            except Exception as e:
+                print(f"Error rendering preview: {e}")
+                image = None
+
+            with self.lock:
+                if generation > self.cancelled:
+                    self.finished = max(self.finished, generation)
+                    if image is not None:
+                        self.result = image
+
+    #Only place where a finished frame is handed back to tk
+    def poll(self):
+        self.poll_id = None
+        with self.lock:
+            result, self.result = self.result, None
+            busy = self.finished < self.generation
+
+        if result is not None:
+            self.on_result(result)
+        if busy:
+            self.poll_id = self.widget.after(RENDER_POLL_MS, self.poll)
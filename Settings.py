@@ -22,4 +22,124 @@ SLIDER_BG = '#64686b'
 
 DROPDOWN_MAIN_COLOR = '#444'
 DROPDOWN_HOVER_COLOR = '#333'
-DROPDOWN_MENU_COLOR = '#666'
\ No newline at end of file
+DROPDOWN_MENU_COLOR = '#666'
+
+#Rendering
+RENDER_POLL_MS = 15
+
+#Thumbnails
+THUMBNAIL_SIZE = 150
+MASONRY_WIDTH = 220
+THUMBNAIL_CACHE_BUDGET = 256 * 1024 * 1024
+THUMBNAIL_CACHE_FORMAT = 'WEBP'
+THUMBNAIL_CACHE_QUALITY = 80
+
+#Previews
+PREVIEW_SIZE = (600, 400)
+PREVIEW_CACHE_BUDGET = 128 * 1024 * 1024
+
+#Profiling, GALLERIE_PROFILE=1 turns it on at startup
+PROFILE_WINDOW = 240
+PROFILE_TRACE_EVENTS = 200000
+PROFILE_BUCKETS_MS = [2, 4, 8, 16, 33, 66, 133, 266]
+PROFILE_OVERLAY_MS = 500
+
+#Decoding
+DECODE_REDUCING_GAP = 2.0
+#Part of the disk cache keys, raised whenever decoding starts producing different pixels
+DECODE_VERSION = 2
+THUMBNAIL_BATCH = 24
+THUMBNAIL_POLL_MS = 30
+
+#Photo grids
+GRID_GAP = 10
+GRID_OVERSCAN = 400
+GRID_SCROLL_STEP = 20
+GRID_IMAGE_CACHE = 400
+#Photos read from the catalog at a time, the next page loads once the end is this many pixels below the screen
+GRID_PAGE = 120
+GRID_PAGE_MARGIN = 800
+THUMBNAIL_COLUMNS = 3
+THUMBNAIL_CARD_HEIGHT = THUMBNAIL_SIZE + 36
+GALLERY_COLUMNS = 4
+GALLERY_CARD_EXTRA = 56
+
+#Sort orders and format filters of the photo grids, labels to Catalog.query arguments
+SORT_OPTIONS = {'Name': 'name', 'Date': 'date', 'Size': 'size', 'Dimensions': 'dimensions'}
+FORMAT_FILTERS = {
+    'All formats': None,
+    'JPEG': ('JPEG', 'MPO'),
+    'PNG': ('PNG',),
+    'WebP': ('WEBP',),
+    'HEIC': ('HEIF',),
+    'GIF': ('GIF',),
+    'BMP': ('BMP',),
+}
+
+#Edit pipeline
+#Smallest blur radius left once a large blur shrinks the image first, per quality tier
+#draft is for the live preview, exact exports stay within a few levels of ImageFilter.GaussianBlur
+BLUR_TIERS = {'draft': 2, 'exact': 8}
+#In memory budget mode the editor keeps a copy the size of the screen, the full resolution is decoded again for export
+MEMORY_BUDGET_MODE = True
+PIPELINE_CACHE_BUDGET = 256 * 1024 * 1024
+
+#Undo history, edits settle into one step once nothing changed for HISTORY_DEBOUNCE_MS
+HISTORY_LIMIT = 100
+HISTORY_DEBOUNCE_MS = 400
+HISTORY_FRAME_BUDGET = 64 * 1024 * 1024
+
+#Every editing parameter with its default, same names as pos_vars, color_vars and effect_vars
+PARAMETER_DEFAULTS = {
+    'rotate': ROTATE_DEFAULT,
+    'zoom': ZOOM_DEFAULT,
+    'flip': FLIP_OPT[0],
+    'brightness': BRIGHTNESS_DEFAULT,
+    'grayscale': GRAYSCALE_DEFAULT,
+    'invert': INVERT_DEFAULT,
+    'vibrance': VIBRANCE_DEFAULT,
+    'blur': BLUR_DEFAULT,
+    'contrast': CONTRAST_DEFAULT,
+    'effect': EFFECT_OPT[0]
+}
+EXPORT_FORMATS = ['jpg', 'png', 'webp']
+RENDER_CACHE_BUDGET = 1024 * 1024 * 1024
+#Disk caches are shared between processes, only temp files this old are leftovers of an interrupted write
+CACHE_TEMP_MAX_AGE = 3600
+
+#Export encoding, every option with its default
+EXPORT_OPTIONS = {
+    'quality': 90,
+    'progressive': False,
+    'optimize': False,
+    'subsampling': '4:2:0',
+    'compress_level': 6,
+    'lossless': False
+}
+SUBSAMPLING_OPT = ['4:4:4', '4:2:2', '4:2:0']
+WEBP_METHOD = 4
+EXPORT_POLL_MS = 100
+EXPORT_STATUS_MS = 4000
+
+#Folder watching
+WATCH_INTERVAL_MS = 2000
+WATCH_FULL_SCAN_TICKS = 5
+
+#Fullscreen viewer
+VIEWER_SIZE = '1000x700'
+VIEWER_TILE_SIZE = 256
+VIEWER_TILE_CACHE = 256
+VIEWER_LEVEL_BUDGET = 512 * 1024 * 1024
+VIEWER_OVERVIEW_SIZE = 2048
+VIEWER_OVERVIEW_BOX = (VIEWER_OVERVIEW_SIZE, VIEWER_OVERVIEW_SIZE)
+VIEWER_ZOOM_STEP = 2 ** 0.25
+VIEWER_MAX_ZOOM = 8
+
+#Duplicate finder, distances are in differing bits of the 64 bit hashes
+DUPLICATE_SAMPLE = 32
+DUPLICATE_DISTANCE = 6
+DUPLICATE_DHASH_DISTANCE = 10
+DUPLICATE_BATCH = 256
+DUPLICATES_SIZE = '900x650'
+DUPLICATE_THUMBNAIL = 140
+DUPLICATE_COLUMNS = 5
@@ -0,0 +1,360 @@
+import customtkinter as ctk
+from tkinter import Canvas
+from collections import OrderedDict
+from PIL import Image, ImageTk
+import math
+import sys
+import threading
+from Settings import *
+from Decode import decode_level, photo_size
+from Loader import PoolLoader, run_in_background
+
+#Mipmap levels of one photo, level n is the photo at 1/2**n of its size
+#Levels are decoded on demand and dropped least recently used once they go over the budget,
+#the overview (the first level that fits in VIEWER_OVERVIEW_SIZE) comes from the shared preview cache instead
+class Pyramid:
+    def __init__(self, path, preview_cache, budget = VIEWER_LEVEL_BUDGET):
+        self.path = path
+        self.preview_cache = preview_cache
+        self.budget = budget
+        self.size = photo_size(path)
+
+        self.top = 0
+        while max(self.size) >> self.top > VIEWER_OVERVIEW_SIZE:
+            self.top += 1
+
+        self.lock = threading.Lock()
+        self.levels = OrderedDict()
+        self.level_locks = {}
+
+    #Smallest level that still has at least one pixel for every pixel on screen
+    def level_for(self, zoom):
+        level = 0
+        while level < self.top and zoom <= 0.5 ** (level + 1):
+            level += 1
+        return level
+
+    #Level images can be a little larger than 1/2**level, tile() works from their real size
+    def level(self, level):
+        if level == self.top:
+            return self.preview_cache.preview(self.path, VIEWER_OVERVIEW_BOX)
+
+        with self.lock:
+            image = self.levels.get(level)
+            if image is not None:
+                self.levels.move_to_end(level)
+                return image
+            level_lock = self.level_locks.setdefault(level, threading.Lock())
+
+        #Only one thread decodes a level, the others wait for it
+        with level_lock:
+            with self.lock:
+                image = self.levels.get(level)
+            if image is not None:
+                return image
+            image = decode_level(self.path, level)
+
+            with self.lock:
+                self.levels[level] = image
+                self.trim(level)
+        return image
+
+    def trim(self, keep):
+        for level in list(self.levels):
+            if self.cached_bytes() <= self.budget:
+                break
+            if level != keep:
+                del self.levels[level]
+
+    def cached_bytes(self):
+        return sum(image.width * image.height * len(image.getbands()) for image in self.levels.values())
+
+    #Tile (column, row) of the photo shown at zoom, cut from the level just above that zoom
+    def tile(self, zoom, column, row):
+        width, height = round(self.size[0] * zoom), round(self.size[1] * zoom)
+        left, top = column * VIEWER_TILE_SIZE, row * VIEWER_TILE_SIZE
+        right, bottom = min(left + VIEWER_TILE_SIZE, width), min(top + VIEWER_TILE_SIZE, height)
+
+        image = self.level(self.level_for(zoom))
+        scale = image.width / width
+        box = (left * scale, top * scale, right * scale, bottom * scale)
+
+        #Resampling reads past the box edges, so neighbouring tiles line up without seams
+        return image.resize((right - left, bottom - top), Image.Resampling.LANCZOS, box = box)
+
+#Zoomable and pannable view of one photo, only the tiles on screen are decoded and uploaded to tk
+#Zoom moves in fixed steps so tiles can be cached per step, the overview is stretched behind them
+#while the sharper tiles are still loading. Left and right flip through paths, the neighbours'
+#overviews are prefetched into the shared preview cache
+class TiledViewer(ctk.CTkToplevel):
+    def __init__(self, master, paths, index, preview_cache):
+        super().__init__(master)
+        self.geometry(VIEWER_SIZE)
+        self.configure(fg_color = BACKGROUND_COLOR)
+        self.paths = paths
+        self.preview_cache = preview_cache
+
+        self.rowconfigure(0, weight = 1)
+        self.columnconfigure(0, weight = 1)
+
+        self.canvas = Canvas(self, background = BACKGROUND_COLOR, bd = 0, highlightthickness = 0)
+        self.canvas.grid(row = 0, column = 0, sticky = 'nsew')
+
+        bar = ctk.CTkFrame(self, fg_color = 'transparent')
+        bar.grid(row = 1, column = 0, sticky = 'ew', padx = 10, pady = 6)
+        ctk.CTkButton(bar, text = "‹", width = 40, command = lambda: self.navigate(-1)).pack(side = 'left')
+        ctk.CTkButton(bar, text = "›", width = 40, command = lambda: self.navigate(1)).pack(side = 'left', padx = 6)
+        self.zoom_label = ctk.CTkLabel(bar, text = '', font = ("Arial", 12))
+        self.zoom_label.pack(side = 'left', padx = 6)
+        ctk.CTkButton(bar, text = "Close", width = 100, command = self.close).pack(side = 'right')
+        ctk.CTkButton(bar, text = "Fit", width = 60, command = self.fit).pack(side = 'right', padx = 6)
+        ctk.CTkButton(bar, text = "100%", width = 60, command = lambda: self.zoom_to(0)).pack(side = 'right')
+
+        #Step n shows the photo at VIEWER_ZOOM_STEP ** n, origin is the display pixel at the top left of the canvas
+        self.step = 0
+        self.zoom = 1
+        self.origin = (0, 0)
+        self.drag = None
+        self.overview = None
+        self.backdrop = None
+        self.pyramid = None
+        self.loader = None
+        self.fitted = False
+
+        #Tile key (step, column, row) -> canvas item on screen, and the most recently used PhotoImages
+        self.items = {}
+        self.tiles = OrderedDict()
+
+        self.canvas.bind('<Configure>', self.on_resize)
+        self.canvas.bind('<ButtonPress-1>', self.start_drag)
+        self.canvas.bind('<B1-Motion>', self.on_drag)
+        self.canvas.bind('<ButtonRelease-1>', self.end_drag)
+        self.bind('<MouseWheel>', self.on_wheel)
+        self.bind('<Button-4>', self.on_wheel)
+        self.bind('<Button-5>', self.on_wheel)
+        self.bind('<Left>', lambda event: self.navigate(-1))
+        self.bind('<Right>', lambda event: self.navigate(1))
+        self.bind('<Escape>', lambda event: self.close())
+        self.bind('<F11>', lambda event: self.attributes('-fullscreen', not self.attributes('-fullscreen')))
+        self.bind('<plus>', lambda event: self.zoom_to(self.step + 1))
+        self.bind('<equal>', lambda event: self.zoom_to(self.step + 1))
+        self.bind('<minus>', lambda event: self.zoom_to(self.step - 1))
+        self.bind('0', lambda event: self.fit())
+        self.bind('1', lambda event: self.zoom_to(0))
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        self.focus_set()
+
+        self.open_photo(index)
+
+    #Drops everything of the current photo and starts on the one at index
+    def open_photo(self, index):
+        self.index = index
+        path = self.paths[index]
+        self.title(path.name)
+
+        if self.loader is not None:
+            self.loader.cancel()
+        self.canvas.delete('all')
+        self.items.clear()
+        self.tiles.clear()
+        self.overview = None
+        self.backdrop = None
+
+        try:
+            self.pyramid = Pyramid(path, self.preview_cache)
+        except Exception as e:
+            self.pyramid = None
+            self.loader = None
+            self.canvas.create_text(20, 20, anchor = 'nw', text = f"Error loading image: {e}", fill = WHITE, font = ("Arial", 14))
+            return
+
+        self.loader = PoolLoader(self, self.pyramid.tile, self.place_tile)
+        pyramid = self.pyramid
+        run_in_background(self, lambda: pyramid.level(pyramid.top), lambda image: self.show_overview(pyramid, image))
+        self.preview_cache.prefetch([self.paths[(index + offset) % len(self.paths)] for offset in (1, -1)], VIEWER_OVERVIEW_BOX)
+
+        #Before the window is mapped the first Configure fits the photo
+        self.step, self.zoom, self.origin = 0, 1, (0, 0)
+        self.fitted = self.canvas.winfo_ismapped()
+        if self.fitted:
+            self.fit()
+
+    def navigate(self, offset):
+        if len(self.paths) > 1:
+            self.open_photo((self.index + offset) % len(self.paths))
+
+    def close(self):
+        if self.loader is not None:
+            self.loader.cancel()
+        self.tiles.clear()
+        self.pyramid = None
+        self.destroy()
+
+    def show_overview(self, pyramid, image):
+        if pyramid is not self.pyramid:
+            return
+        if image is None:
+            self.canvas.create_text(20, 20, anchor = 'nw', text = "Error loading image", fill = WHITE, font = ("Arial", 14))
+            return
+        self.overview = image
+        self.draw_backdrop()
+
+    #Zoom steps between fitting the whole photo and VIEWER_MAX_ZOOM
+    def step_range(self):
+        width, height = self.pyramid.size
+        fit = min(self.canvas.winfo_width() / width, self.canvas.winfo_height() / height, 1)
+        lowest = math.floor(math.log(fit, VIEWER_ZOOM_STEP))
+        return lowest, round(math.log(VIEWER_MAX_ZOOM, VIEWER_ZOOM_STEP))
+
+    def display_size(self):
+        return round(self.pyramid.size[0] * self.zoom), round(self.pyramid.size[1] * self.zoom)
+
+    def on_resize(self, event):
+        if self.pyramid is None:
+            return
+        if not self.fitted:
+            self.fitted = True
+            self.fit()
+        else:
+            self.set_origin(*self.origin)
+            self.refresh()
+
+    def fit(self):
+        self.zoom_to(self.step_range()[0])
+
+    #Zooms around a point on the canvas, the center when none is given
+    def zoom_to(self, step, x = None, y = None):
+        if self.pyramid is None:
+            return
+        lowest, highest = self.step_range()
+        step = max(lowest, min(highest, step))
+        if x is None:
+            x, y = self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2
+
+        #Photo pixel under the point stays under it
+        ratio = VIEWER_ZOOM_STEP ** step / self.zoom
+        origin = ((self.origin[0] + x) * ratio - x, (self.origin[1] + y) * ratio - y)
+        self.step = step
+        self.zoom = VIEWER_ZOOM_STEP ** step
+        self.zoom_label.configure(text = f"{self.zoom * 100:.0f}%  ·  {self.pyramid.size[0]} × {self.pyramid.size[1]}")
+
+        #Tiles of the old step are no use anymore, the backdrop covers the gap until the new ones arrive
+        self.canvas.delete('tile')
+        self.items.clear()
+        self.set_origin(*origin)
+        self.refresh()
+
+    #Keeps the photo on screen, centered along any side where it is smaller than the canvas
+    def set_origin(self, x, y):
+        width, height = self.display_size()
+        canvas_width, canvas_height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        x = (width - canvas_width) / 2 if width <= canvas_width else max(0, min(width - canvas_width, x))
+        y = (height - canvas_height) / 2 if height <= canvas_height else max(0, min(height - canvas_height, y))
+        self.origin = (round(x), round(y))
+
+    def on_wheel(self, event):
+        if event.num == 4:
+            step = 1
+        elif event.num == 5:
+            step = -1
+        elif sys.platform == 'darwin':
+            step = 1 if event.delta > 0 else -1
+        else:
+            step = int(event.delta / 120)
+        if step:
+            x = event.x_root - self.canvas.winfo_rootx()
+            y = event.y_root - self.canvas.winfo_rooty()
+            self.zoom_to(self.step + step, x, y)
+
+    def start_drag(self, event):
+        self.drag = (event.x, event.y)
+
+    #Panning only moves what is already on the canvas, new tiles are asked for on the way
+    def on_drag(self, event):
+        if self.drag is None:
+            return
+        previous = self.origin
+        self.set_origin(self.origin[0] - event.x + self.drag[0], self.origin[1] - event.y + self.drag[1])
+        self.drag = (event.x, event.y)
+        self.canvas.move('all', previous[0] - self.origin[0], previous[1] - self.origin[1])
+        self.refresh(backdrop = False)
+
+    def end_drag(self, event):
+        self.drag = None
+        self.draw_backdrop()
+
+    def visible_tiles(self):
+        width, height = self.display_size()
+        left, top = max(0, self.origin[0]), max(0, self.origin[1])
+        right = min(width, self.origin[0] + self.canvas.winfo_width())
+        bottom = min(height, self.origin[1] + self.canvas.winfo_height())
+        if right <= left or bottom <= top:
+            return []
+
+        columns = range(left // VIEWER_TILE_SIZE, (right - 1) // VIEWER_TILE_SIZE + 1)
+        rows = range(top // VIEWER_TILE_SIZE, (bottom - 1) // VIEWER_TILE_SIZE + 1)
+        return [(self.step, column, row) for row in rows for column in columns]
+
+    def refresh(self, backdrop = True):
+        if self.pyramid is None:
+            return
+
+        wanted = self.visible_tiles()
+        wanted_set = set(wanted)
+        for key in [key for key in self.items if key not in wanted_set]:
+            self.canvas.delete(self.items.pop(key))
+        for key in self.loader.pending():
+            if key not in wanted_set:
+                self.loader.discard(key)
+
+        for key in wanted:
+            if key in self.items:
+                continue
+            if key in self.tiles:
+                self.tiles.move_to_end(key)
+                self.show_tile(key)
+            else:
+                self.loader.load(key, self.zoom, key[1], key[2])
+
+        if backdrop:
+            self.draw_backdrop()
+
+    def show_tile(self, key):
+        step, column, row = key
+        x = column * VIEWER_TILE_SIZE - self.origin[0]
+        y = row * VIEWER_TILE_SIZE - self.origin[1]
+        self.items[key] = self.canvas.create_image(x, y, image = self.tiles[key], anchor = 'nw', tags = 'tile')
+
+    def place_tile(self, key, image, error):
+        if image is None:
+            print(f"Error loading tile {key}: {error}")
+            return
+
+        #PhotoImages can only be made on the main loop
+        self.tiles[key] = ImageTk.PhotoImage(image)
+        if len(self.tiles) > VIEWER_TILE_CACHE:
+            self.tiles.popitem(last = False)
+
+        if key[0] == self.step and key not in self.items and key in set(self.visible_tiles()):
+            self.show_tile(key)
+
+    #Overview stretched over the visible part of the photo, under the tiles
+    def draw_backdrop(self):
+        self.canvas.delete('backdrop')
+        self.backdrop = None
+        if self.overview is None or self.pyramid is None:
+            return
+
+        width, height = self.display_size()
+        left, top = max(0, self.origin[0]), max(0, self.origin[1])
+        right = min(width, self.origin[0] + self.canvas.winfo_width())
+        bottom = min(height, self.origin[1] + self.canvas.winfo_height())
+        if right <= left or bottom <= top:
+            return
+
+        scale = self.overview.width / width
+        box = (left * scale, top * scale, right * scale, bottom * scale)
+        image = self.overview.resize((right - left, bottom - top), Image.Resampling.BILINEAR, box = box)
+        self.backdrop = ImageTk.PhotoImage(image)
+        self.canvas.create_image(left - self.origin[0], top - self.origin[1], image = self.backdrop, anchor = 'nw', tags = 'backdrop')
+        self.canvas.tag_lower('backdrop')
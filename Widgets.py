@@ -1,11 +1,15 @@
 import customtkinter as ctk
 from tkinter import filedialog, Canvas
+from bisect import bisect_left, bisect_right
+from PIL import Image
+import sys
 from Settings import *
+from Profiler import peak_rss
 
 class MainMenu(ctk.CTkFrame):
     def __init__(self, master, on_import, on_edit, on_gallery, on_exit):
         super().__init__(master)
-        self.grid(column = 0, columnspan = 2, row = 0, sticky = 'nsew')
+        self.show()
         self.on_import = on_import
         self.on_edit = on_edit
         self.on_gallery = on_gallery
@@ -28,6 +32,9 @@ class MainMenu(ctk.CTkFrame):
         exit_btn = ctk.CTkButton(self, text="Exit", width = 200, height = 50, font=("Arial", 18), fg_color="#c0392b", hover_color="#e74c3c", command=on_exit)
         exit_btn.pack(expand = True)
 
+    def show(self):
+        self.grid(column = 0, columnspan = 2, row = 0, sticky = 'nsew')
+
     def open_dialog(self):
         path = filedialog.askopenfile().name
         self.on_import(path)
@@ -47,7 +54,391 @@ class Import_Page(Canvas):
         self.grid(row = 0,column = 1, sticky = 'nsew', padx = 10, pady = 10)
         self.bind('<Configure>', resize_image)
 
+#Progress of the export queue in the bottom right corner, hidden while nothing is exporting
+class ExportStatus(ctk.CTkFrame):
+    def __init__(self, master, on_cancel):
+        super().__init__(master, fg_color = DARK_GREY)
+        self.hide_id = None
+
+        self.label = ctk.CTkLabel(self, text = '', font = ("Arial", 12))
+        self.label.pack(side = 'left', padx = 10, pady = 6)
+        self.progress = ctk.CTkProgressBar(self, width = 120)
+        self.progress.pack(side = 'left', padx = 6)
+        self.cancel_button = ctk.CTkButton(self, text = 'Cancel', width = 70, fg_color = CLOSE_RED, command = on_cancel)
+        self.cancel_button.pack(side = 'left', padx = 6, pady = 6)
+
+    def update_jobs(self, jobs):
+        if self.hide_id is not None:
+            self.after_cancel(self.hide_id)
+            self.hide_id = None
+
+        finished = [job for job in jobs if not job.active()]
+        failed = [job for job in finished if job.state == 'failed']
+        running = [job for job in jobs if job.state in ('rendering', 'encoding')]
+
+        self.progress.set(len(finished) / max(1, len(jobs)))
+        if len(finished) < len(jobs):
+            current = f"{running[0].state.capitalize()} {running[0].name}" if running else "Waiting"
+            self.label.configure(text = f"{current}  ({len(finished)}/{len(jobs)})")
+            self.cancel_button.pack(side = 'left', padx = 6, pady = 6)
+        else:
+            done = sum(job.state == 'done' for job in finished)
+            text = f"Exported {done} of {len(jobs)}"
+            if failed:
+                text += f", {failed[0].name} failed: {failed[0].error}"
+            self.label.configure(text = text)
+            self.cancel_button.pack_forget()
+            self.hide_id = self.after(EXPORT_STATUS_MS, self.place_forget)
+
+        self.place(relx = 1, rely = 1, x = -10, y = -10, anchor = 'se')
+        self.lift()
+
+#Frame latency, stage timings and memory drawn over the editor canvas, F3 toggles it and F4 writes a trace file
+class PerformanceOverlay:
+    BARS = ' ▁▂▃▄▅▆▇█'
+
+    def __init__(self, canvas, profiler):
+        self.canvas = canvas
+        self.profiler = profiler
+        self.after_id = None
+
+    def show(self):
+        self.profiler.enabled = True
+        self.draw()
+
+    def hide(self):
+        self.profiler.enabled = self.profiler.always_on
+        if self.after_id is not None:
+            self.canvas.after_cancel(self.after_id)
+            self.after_id = None
+        self.canvas.delete('overlay')
+
+    def toggle(self):
+        if self.after_id is not None:
+            self.hide()
+        else:
+            self.show()
+
+    def draw(self):
+        self.after_id = self.canvas.after(PROFILE_OVERLAY_MS, self.draw)
+        rss, peak = self.profiler.sample_memory(), peak_rss()
+        stats = self.profiler.stats()
+
+        lines = []
+        frame = stats.get('frame')
+        if frame is not None:
+            counts = self.profiler.histogram('frame')
+            top = max(counts) or 1
+            bars = ''.join(self.BARS[round(count / top * (len(self.BARS) - 1))] for count in counts)
+            lines.append(f"frame  p50 {frame['p50'] * 1000:6.1f}  p95 {frame['p95'] * 1000:6.1f}  max {frame['max'] * 1000:6.1f} ms")
+            lines.append(f"       |{bars}|  <={' '.join(str(edge) for edge in PROFILE_BUCKETS_MS)} ms")
+        for name in sorted(stats):
+            if name != 'frame':
+                lines.append(f"{name:<14} last {stats[name]['last'] * 1000:7.1f}  p50 {stats[name]['p50'] * 1000:7.1f} ms")
+        if rss is not None:
+            lines.append(f"rss {rss / 1024 / 1024:.0f} MB   peak {peak / 1024 / 1024:.0f} MB" if peak else f"rss {rss / 1024 / 1024:.0f} MB")
+        lines.append("F3 hide   F4 save trace")
+
+        self.canvas.delete('overlay')
+        text = self.canvas.create_text(12, 12, anchor = 'nw', text = '\n'.join(lines), fill = WHITE, font = ('Courier', 10), tags = 'overlay')
+        left, top, right, bottom = self.canvas.bbox(text)
+        self.canvas.create_rectangle(left - 6, top - 6, right + 6, bottom + 6, fill = 'black', outline = '', stipple = 'gray50', tags = 'overlay')
+        self.canvas.tag_raise(text)
+
 class CloseButton(ctk.CTkButton):
     def __init__(self, master, close):
         super().__init__(master, command = close, text = 'x', text_color =  WHITE, fg_color = 'transparent', width = 40, height = 40, hover_color = CLOSE_RED)
-        self.place(relx = 0.99, rely = 0.01, anchor = 'ne')
\ No newline at end of file
+        self.place(relx = 0.99, rely = 0.01, anchor = 'ne')
+
+#Scrollable grid that only keeps the cards near the viewport as real widgets
+#Cards leaving the viewport are recycled for the ones coming in, make_card(master) builds a new card,
+#bind_card(card, item) fills it and unbind_card(card, item) is called when it scrolls away
+class VirtualGrid(ctk.CTkFrame):
+    wheel_bound = False
+
+    def __init__(self, master, column_width, columns, make_card, bind_card, unbind_card, fg_color, empty_text = '', on_end = None):
+        super().__init__(master, fg_color = fg_color)
+        self.column_width = column_width
+        self.columns = columns
+        self.make_card = make_card
+        self.bind_card = bind_card
+        self.unbind_card = unbind_card
+        self.empty_text = empty_text
+        self.on_end = on_end
+
+        self.rowconfigure(0, weight = 1)
+        self.columnconfigure(0, weight = 1)
+
+        self.canvas = Canvas(self, background = fg_color, bd = 0, highlightthickness = 0, yscrollincrement = GRID_SCROLL_STEP)
+        self.canvas.grid(row = 0, column = 0, sticky = 'nsew', padx = (6, 0), pady = 6)
+        self.scrollbar = ctk.CTkScrollbar(self, command = self.canvas.yview)
+        self.scrollbar.grid(row = 0, column = 1, sticky = 'ns', pady = 6)
+
+        self.canvas.configure(yscrollcommand = self.on_scroll)
+        self.canvas.bind('<Configure>', self.on_resize)
+
+        self.items = []
+        self.positions = []
+        self.column_items = []
+        self.column_tops = []
+        self.column_bottoms = []
+        self.total_height = 0
+        self.offset = 0
+
+        #index -> card on screen, card -> canvas window, item -> card on screen
+        self.visible = {}
+        self.windows = {}
+        self.cards = {}
+        self.free = []
+
+        #One handler for every grid, it scrolls whichever grid is under the mouse
+        if not VirtualGrid.wheel_bound:
+            self.bind_all('<MouseWheel>', VirtualGrid.on_wheel, add = '+')
+            self.bind_all('<Button-4>', VirtualGrid.on_wheel, add = '+')
+            self.bind_all('<Button-5>', VirtualGrid.on_wheel, add = '+')
+            VirtualGrid.wheel_bound = True
+
+    def set_items(self, items, positions, total_height):
+        for index in list(self.visible):
+            self.hide(index)
+
+        self.apply_layout(items, positions, total_height)
+        self.canvas.yview_moveto(0)
+        self.refresh()
+
+    #Applies a changed item list without a rebuild, cards keep their item and only move if their position changed
+    def update_items(self, items, positions, total_height):
+        new_index = {item: index for index, item in enumerate(items)}
+        visible, self.visible = self.visible, {}
+
+        for old_index, card in visible.items():
+            item = self.items[old_index]
+            index = new_index.get(item)
+            if index is None:
+                self.cards.pop(item, None)
+                self.unbind_card(card, item)
+                self.canvas.coords(self.windows[card], 0, -10000)
+                self.free.append(card)
+                continue
+
+            self.visible[index] = card
+            col, y, height = positions[index]
+            if positions[index] != self.positions[old_index]:
+                self.canvas.coords(self.windows[card], self.column_x(col), y)
+                self.canvas.itemconfigure(self.windows[card], height = height)
+
+        self.apply_layout(items, positions, total_height)
+        self.refresh()
+
+    #Fills the card of item again, for example after its file changed
+    def rebind_item(self, item):
+        card = self.cards.get(item)
+        if card is not None:
+            self.bind_card(card, item)
+
+    def rebind_visible(self):
+        for index, card in self.visible.items():
+            self.bind_card(card, self.items[index])
+
+    def apply_layout(self, items, positions, total_height):
+        self.items = items
+        self.positions = positions
+        self.total_height = total_height
+
+        #Cards of a column are in y order, so the visible ones can be found with bisect
+        self.column_items = [[] for _ in range(self.columns)]
+        for index, (col, y, height) in enumerate(positions):
+            self.column_items[col].append(index)
+        self.column_tops = [[positions[index][1] for index in column] for column in self.column_items]
+        self.column_bottoms = [[positions[index][1] + positions[index][2] for index in column] for column in self.column_items]
+
+        self.canvas.configure(scrollregion = (0, 0, self.canvas.winfo_width(), max(total_height, 1)))
+
+        self.canvas.delete('empty')
+        if not items and self.empty_text:
+            self.canvas.create_text(self.canvas.winfo_width() / 2, 30, text = self.empty_text, fill = WHITE, font = ("Arial", 14), tags = 'empty')
+
+    def card_for(self, item):
+        return self.cards.get(item)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.refresh()
+
+    def on_resize(self, event):
+        #Columns stay centered in the available width
+        self.offset = max(0, (event.width - self.columns * self.column_width) // 2)
+        self.canvas.configure(scrollregion = (0, 0, event.width, max(self.total_height, 1)))
+        self.canvas.coords('empty', event.width / 2, 30)
+
+        for index, card in self.visible.items():
+            col, y, height = self.positions[index]
+            self.canvas.coords(self.windows[card], self.column_x(col), y)
+        self.refresh()
+
+    def column_x(self, col):
+        return self.offset + col * self.column_width + GRID_GAP / 2
+
+    def refresh(self):
+        if not self.items:
+            return
+
+        top = self.canvas.canvasy(0) - GRID_OVERSCAN
+        bottom = self.canvas.canvasy(self.canvas.winfo_height()) + GRID_OVERSCAN
+
+        wanted = set()
+        for col, column in enumerate(self.column_items):
+            start = bisect_left(self.column_bottoms[col], top)
+            end = bisect_right(self.column_tops[col], bottom)
+            wanted.update(column[start:end])
+
+        for index in [index for index in self.visible if index not in wanted]:
+            self.hide(index)
+        for index in sorted(wanted):
+            if index not in self.visible:
+                self.show(index)
+
+        #Items are loaded a page at a time, the next one is asked for before the end scrolls into view
+        if self.on_end is not None and bottom + GRID_PAGE_MARGIN >= self.total_height:
+            self.on_end()
+
+    def show(self, index):
+        col, y, height = self.positions[index]
+        x = self.column_x(col)
+
+        if self.free:
+            card = self.free.pop()
+            self.canvas.coords(self.windows[card], x, y)
+            self.canvas.itemconfigure(self.windows[card], height = height)
+        else:
+            card = self.make_card(self.canvas)
+            self.windows[card] = self.canvas.create_window(x, y, window = card, anchor = 'nw',
+                                                            width = self.column_width - GRID_GAP, height = height)
+
+        item = self.items[index]
+        self.visible[index] = card
+        self.cards[item] = card
+        self.bind_card(card, item)
+
+    def hide(self, index):
+        card = self.visible.pop(index)
+        item = self.items[index]
+        self.cards.pop(item, None)
+        self.unbind_card(card, item)
+
+        #Parked above the content instead of destroyed, ready for the next card that scrolls in
+        self.canvas.coords(self.windows[card], 0, -10000)
+        self.free.append(card)
+
+    @staticmethod
+    def on_wheel(event):
+        try:
+            widget = event.widget.winfo_containing(event.x_root, event.y_root)
+        except (KeyError, AttributeError):
+            return
+
+        while widget is not None and not isinstance(widget, VirtualGrid):
+            widget = widget.master
+        if widget is None:
+            return
+
+        if event.num == 4:
+            step = -3
+        elif event.num == 5:
+            step = 3
+        elif sys.platform == 'darwin':
+            step = -event.delta
+        else:
+            step = -3 * int(event.delta / 120)
+        widget.canvas.yview_scroll(step, 'units')
+
+#Sort order, filename search and format filter above a photo grid
+#on_change(query) gets the keyword arguments for Catalog.query whenever one of them changes
+class QueryBar(ctk.CTkFrame):
+    def __init__(self, master, on_change):
+        super().__init__(master, fg_color = 'transparent')
+        self.on_change = on_change
+        self.query = {'sort': 'name', 'descending': False, 'search': '', 'formats': None}
+
+        self.count_label = ctk.CTkLabel(self, text = '', font = ("Arial", 12))
+        self.count_label.pack(side = 'left', padx = 10)
+
+        self.search_entry = ctk.CTkEntry(self, placeholder_text = 'Search', width = 160)
+        self.search_entry.pack(side = 'left', padx = 4)
+        self.search_entry.bind('<KeyRelease>', lambda event: self.set(search = self.search_entry.get().strip()))
+
+        self.format_menu = ctk.CTkOptionMenu(self, values = list(FORMAT_FILTERS), width = 120,
+                                             command = lambda value: self.set(formats = FORMAT_FILTERS[value]))
+        self.format_menu.pack(side = 'left', padx = 4)
+
+        self.sort_menu = ctk.CTkOptionMenu(self, values = list(SORT_OPTIONS), width = 120,
+                                           command = lambda value: self.set(sort = SORT_OPTIONS[value]))
+        self.sort_menu.pack(side = 'left', padx = 4)
+
+        self.direction_button = ctk.CTkButton(self, text = '↑', width = 32, command = self.toggle_direction)
+        self.direction_button.pack(side = 'left', padx = 4)
+
+    def toggle_direction(self):
+        descending = not self.query['descending']
+        self.direction_button.configure(text = '↓' if descending else '↑')
+        self.set(descending = descending)
+
+    def set(self, **changes):
+        if all(self.query[name] == value for name, value in changes.items()):
+            return
+        self.query.update(changes)
+        self.on_change(dict(self.query))
+
+    def show_count(self, count):
+        self.count_label.configure(text = f"{count} photos")
+
+#Card of the manager grid
+class ThumbnailCard(ctk.CTkFrame):
+    def __init__(self, master, on_click):
+        super().__init__(master, fg_color = 'transparent')
+        self.path = None
+        self.blank = ctk.CTkImage(light_image = Image.new('RGBA', (1, 1)), size = (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+
+        self.button = ctk.CTkButton(self, image = self.blank, text = '', width = THUMBNAIL_SIZE, height = THUMBNAIL_SIZE,
+                                    command = lambda: on_click(self.path))
+        self.button.pack()
+
+        self.name_label = ctk.CTkLabel(self, text = '', font = ("Arial", 10))
+        self.name_label.pack()
+
+    def show(self, path, image):
+        self.path = path
+        self.name_label.configure(text = path.name)
+        self.set_image(image)
+
+    def set_image(self, image):
+        self.button.configure(image = self.blank if image is None else image)
+
+    def set_error(self):
+        self.name_label.configure(text = f'{self.name_label.cget("text")} (unreadable)')
+
+#Card of the gallery columns, its height follows the photo
+class GalleryCard(ctk.CTkFrame):
+    def __init__(self, master, on_click):
+        super().__init__(master, fg_color = DARK_GREY, corner_radius = 10)
+        self.path = None
+        self.blank = ctk.CTkImage(light_image = Image.new('RGBA', (1, 1)), size = (MASONRY_WIDTH, MASONRY_WIDTH))
+
+        self.button = ctk.CTkButton(self, image = self.blank, text = '', fg_color = 'transparent', hover_color = GREY,
+                                    command = lambda: on_click(self.path))
+        self.button.pack(padx = 5, pady = 5)
+
+        self.name_label = ctk.CTkLabel(self, text = '', font = ("Arial", 11, "bold"))
+        self.name_label.pack(padx = 10, pady = (0, 10))
+
+    def show(self, path, image, height):
+        self.path = path
+        self.name_label.configure(text = path.stem)
+        self.blank.configure(size = (MASONRY_WIDTH, height))
+        self.set_image(image)
+
+    def set_image(self, image):
+        self.button.configure(image = self.blank if image is None else image)
+
+    def set_error(self):
+        self.name_label.configure(text = f'{self.name_label.cget("text")} (unreadable)')